@@ -13,13 +13,172 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+# To be able to use the enclosing class type in class method type hints
+from __future__ import annotations
+
+import dataclasses
+from array import array
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, Union
+
 from pygit2 import Commit, Diff
 
 
+def is_nullfile(fn):
+    return fn == "/dev/null"
+
+
+@dataclass(frozen=True)
+class DiffHunk:
+    old_start: int
+    old_lines: int
+    new_start: int
+    new_lines: int
+    lines: str = dataclasses.field(default_factory=tuple)
+
+    @staticmethod
+    def from_tup(old_start_and_lines, new_start_and_lines):
+        old_start, old_lines = old_start_and_lines
+        new_start, new_lines = new_start_and_lines
+        return DiffHunk(
+            old_start=old_start,
+            old_lines=old_lines,
+            new_start=new_start,
+            new_lines=new_lines,
+        )
+
+
+@dataclass(frozen=True)
+class DiffFile:
+    path: str
+
+
+@dataclass(frozen=True)
+class DiffDelta:
+    old_file: DiffFile
+    new_file: DiffFile
+    is_binary: bool
+
+    @staticmethod
+    def from_paths(old_file_path, new_file_path):
+        return DiffDelta(
+            old_file=DiffFile(old_file_path),
+            new_file=DiffFile(new_file_path),
+            is_binary=False,
+        )
+
+
+@dataclass(frozen=True)
+class DiffLine:
+    content: str
+
+
+@dataclass(frozen=True)
+class Patch:
+    delta: DiffDelta
+    hunks: list[DiffHunk]
+
+
+@dataclass
+class HunkTable:
+    """
+    The file paths and hunk ranges of a diff, stored column-wise in integer
+    arrays instead of as one object per file and hunk. The hunks of file i
+    are the rows hunk_offsets[i] to hunk_offsets[i + 1] of the hunk columns.
+    """
+
+    old_paths: List[str]
+    new_paths: List[str]
+    is_binary: array
+    hunk_offsets: array
+    old_start: array
+    old_lines: array
+    new_start: array
+    new_lines: array
+
+    @staticmethod
+    def from_diff(diff: Union[Diff, List[Patch]]) -> HunkTable:
+        table = HunkTable(
+            old_paths=[],
+            new_paths=[],
+            is_binary=array("b"),
+            hunk_offsets=array("i", [0]),
+            old_start=array("i"),
+            old_lines=array("i"),
+            new_start=array("i"),
+            new_lines=array("i"),
+        )
+        for patch in diff:
+            table.old_paths.append(patch.delta.old_file.path)
+            table.new_paths.append(patch.delta.new_file.path)
+            table.is_binary.append(patch.delta.is_binary)
+            if not patch.delta.is_binary:
+                for hunk in patch.hunks:
+                    table.old_start.append(hunk.old_start)
+                    table.old_lines.append(hunk.old_lines)
+                    table.new_start.append(hunk.new_start)
+                    table.new_lines.append(hunk.new_lines)
+            table.hunk_offsets.append(len(table.old_start))
+        return table
+
+    def __len__(self):
+        return len(self.old_paths)
+
+    def delta_paths(self) -> List[Tuple[str, str]]:
+        return list(zip(self.old_paths, self.new_paths))
+
+    def __iter__(self) -> Iterator[Patch]:
+        for i in range(len(self)):
+            yield self.patch(i)
+
+    def patch(self, i: int) -> Patch:
+        return Patch(
+            delta=DiffDelta(
+                old_file=DiffFile(self.old_paths[i]),
+                new_file=DiffFile(self.new_paths[i]),
+                is_binary=bool(self.is_binary[i]),
+            ),
+            hunks=[
+                DiffHunk(
+                    self.old_start[h],
+                    self.old_lines[h],
+                    self.new_start[h],
+                    self.new_lines[h],
+                )
+                for h in range(self.hunk_offsets[i], self.hunk_offsets[i + 1])
+            ],
+        )
+
+
 class CommitDiff(object):
-    def __init__(self, pygit_commit: Commit, pygit_diff: Diff):
+    def __init__(
+        self, pygit_commit: Commit, pygit_diff: Union[Diff, HunkTable]
+    ):
         self.header = pygit_commit
-        self.filepatches = [patch for patch in pygit_diff]
+        if isinstance(pygit_diff, HunkTable):
+            # Patches are created from the table when iterated
+            self.filepatches = pygit_diff
+        else:
+            self.filepatches = [patch for patch in pygit_diff]
+
+    def delta_paths(self) -> List[Tuple[str, str]]:
+        if isinstance(self.filepatches, HunkTable):
+            return self.filepatches.delta_paths()
+        return [
+            (patch.delta.old_file.path, patch.delta.new_file.path)
+            for patch in self.filepatches
+        ]
+
+    def key(self) -> Optional[Tuple]:
+        """
+        Identify the content of the diff without looking at its hunks, or
+        return None if it cannot be identified. A commit always has the same
+        diff, but not necessarily the same selection of file patches.
+        """
+        if not isinstance(self.header, Commit):
+            return None
+        return (self.header.id, tuple(self.delta_paths()))
 
     def __repr__(self):
         return "<CommitDiff: %s %s>" % (self.header, self.filepatches)
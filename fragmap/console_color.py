@@ -26,3 +26,7 @@ ANSI_FG_BRIGHT_BLACK = ANSI_ESC + "[90m"
 ANSI_RESET = ANSI_ESC + "[0m"
 ANSI_UP = ANSI_ESC + "[1A"
 ANSI_DOWN = ANSI_ESC + "[1B"
+# Format with the number of lines to move
+ANSI_UP_LINES = ANSI_ESC + "[%dA"
+ANSI_DOWN_LINES = ANSI_ESC + "[%dB"
+ANSI_ERASE_TO_LINE_END = ANSI_ESC + "[K"
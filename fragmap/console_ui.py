@@ -14,18 +14,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
 from backports.shutil_get_terminal_size import get_terminal_size
 
 from fragmap.common_ui import first_line
-from fragmap.console_color import ANSI_FG_BRIGHT_BLACK, ANSI_FG_CYAN, ANSI_RESET
+from fragmap.console_color import (
+    ANSI_DOWN_LINES,
+    ANSI_ERASE_TO_LINE_END,
+    ANSI_FG_BRIGHT_BLACK,
+    ANSI_FG_CYAN,
+    ANSI_RESET,
+    ANSI_UP_LINES,
+)
 from fragmap.generate_matrix import (
     ColumnMajorMatrix,
     ConnectedFragmap,
     RowMajorMatrix,
+    Viewport,
     find_squashable,
+    render_kinds_for_console,
 )
 
 
+class ViewportError(RuntimeError):
+    pass
+
+
+def check_column_offset(viewport: Viewport, n_columns: int):
+    if viewport.column_offset and viewport.column_offset >= n_columns:
+        raise ViewportError(
+            "Error: The column offset %d is past the last of the %d columns."
+            % (viewport.column_offset, n_columns)
+        )
+
+
 def filter_consecutive_equal_columns(
     char_matrix: RowMajorMatrix[str],
 ) -> RowMajorMatrix[str]:
@@ -42,11 +66,40 @@ def filter_consecutive_equal_columns(
     return filtered_matrix.row_major()
 
 
-def print_fragmap(fragmap, do_color):
-    matrix = fragmap.render_for_console(do_color)
-    matrix = filter_consecutive_equal_columns(matrix)
-    if len(matrix) == 0:
-        return 0, 0
+def render_fragmap_lines(
+    fragmap, do_color, viewport: Viewport = Viewport()
+) -> Tuple[List[str], int]:
+    """
+    Render the lines of the commits and the cells of the fragmap in the
+    viewport, and return them with their width. Equal neighboring columns are
+    merged first, so the columns of the viewport are the merged columns.
+    """
+    if isinstance(fragmap, ConnectedFragmap):
+        # The cells are merged by their characters, so all of them are
+        # rendered
+        matrix = filter_consecutive_equal_columns(
+            fragmap.render_for_console(
+                do_color,
+                Viewport(
+                    row_offset=viewport.row_offset, max_rows=viewport.max_rows
+                ),
+            )
+        )
+        n_columns = len(matrix[0]) if matrix else 0
+        columns = viewport.columns(n_columns)
+        matrix = RowMajorMatrix(
+            [row[columns.start : columns.stop] for row in matrix]
+        )
+    else:
+        kind_matrix = fragmap.generate_kind_matrix()
+        distinct_columns = kind_matrix.distinct_columns()
+        n_columns = len(distinct_columns)
+        matrix = render_kinds_for_console(
+            kind_matrix, do_color, viewport, distinct_columns
+        )
+    check_column_offset(viewport, n_columns)
+    if len(matrix) == 0 or len(matrix[0]) == 0:
+        return [], 0
     matrix_width = len(matrix[0])
     hash_width = 8
     padded_matrix_width = matrix_width
@@ -56,8 +109,10 @@ def print_fragmap(fragmap, do_color):
         reported_terminal_column_size = 80
     # Note: Subtracting two because ConEmu/Cmder line wraps two columns before
     terminal_column_size = reported_terminal_column_size - 2
+    patches = fragmap.patches()
+    rows = viewport.rows(len(patches))
     max_actual_commit_width = max(
-        [len(first_line(p.header.message)) for p in fragmap.patches()]
+        [len(first_line(patches[r].header.message)) for r in rows]
     )
     max_commit_width = max(
         0,
@@ -71,28 +126,28 @@ def print_fragmap(fragmap, do_color):
         hash_width + 1 + max_commit_width + 1 + padded_matrix_width
     )
 
+    # Shares the matrix that was rendered above
     squashable = [
-        pair.row for pair in find_squashable(fragmap.generate_matrix())
+        pair.row for pair in find_squashable(fragmap.generate_kind_matrix())
     ]
 
-    def infill_layout(matrix, print_text_action, print_matrix_action):
-        r = 0
+    def infill_layout(matrix, text_action, matrix_action):
         for i in range(len(matrix)):
-            r = i / 3
+            r = i // 3
             if i % 3 == 1:
-                print_text_action(r)
+                text = text_action(r)
             else:
-                print("".ljust(hash_width + 1 + max_commit_width), end="")
-            print_matrix_action(i)
+                text = "".ljust(hash_width + 1 + max_commit_width)
+            yield text + matrix_action(i)
 
-    def normal_layout(matrix, print_text_action, print_matrix_action):
+    def normal_layout(matrix, text_action, matrix_action):
         for r in range(len(matrix)):
-            print_text_action(r)
-            print_matrix_action(r)
+            yield text_action(r) + matrix_action(r)
 
     # Draw the text and matrix
-    def print_line(r):
-        cur_patch = fragmap.patches()[r].header
+    def text_line(r):
+        r = rows[r]
+        cur_patch = patches[r].header
         commit_msg = first_line(cur_patch.message)
         hash_string = str(cur_patch.id)
         # Pad short commit messages
@@ -105,14 +160,67 @@ def print_fragmap(fragmap, do_color):
         hash_string = hash_string[0:hash_width]
         if do_color:
             hash_string = ANSI_FG_CYAN + hash_string + ANSI_RESET
-        print(hash_string, commit_msg, end="")
+        return hash_string + " " + commit_msg
 
-    def print_matrix(r):
-        print("".join(matrix[r]), " ")
+    def matrix_line(r):
+        return "".join(matrix[r]) + "  "
 
     if isinstance(fragmap, ConnectedFragmap):
-        infill_layout(matrix, print_line, print_matrix)
+        lines = infill_layout(matrix, text_line, matrix_line)
     else:
-        normal_layout(matrix, print_line, print_matrix)
-    lines_printed = len(matrix)
-    return lines_printed, actual_total_width
+        lines = normal_layout(matrix, text_line, matrix_line)
+    return list(lines), actual_total_width
+
+
+def print_fragmap(fragmap, do_color, viewport: Viewport = Viewport()):
+    """
+    Print the lines of render_fragmap_lines() and return how many they were
+    and their width.
+    """
+    lines, width = render_fragmap_lines(fragmap, do_color, viewport)
+    for line in lines:
+        print(line)
+    return len(lines), width
+
+
+@dataclass
+class Repainter:
+    """
+    Keeps the lines that were last written to the console, to replace them
+    with new lines by only writing the lines that changed. The cursor is
+    expected to be at the start of the line below the written lines, and is
+    left below the new lines.
+    """
+
+    lines: List[str] = field(default_factory=lambda: [])
+
+    def repaint(self, lines: List[str]) -> str:
+        """
+        Return the text that replaces the written lines with the new lines
+        when written to the console, all in one go.
+        """
+        out = []
+        cursor = len(self.lines)
+
+        def move_to(line):
+            if line < cursor:
+                out.append(ANSI_UP_LINES % (cursor - line))
+            elif line > cursor:
+                out.append(ANSI_DOWN_LINES % (line - cursor))
+            out.append("\r")
+            return line
+
+        for i in range(min(len(lines), len(self.lines))):
+            if lines[i] != self.lines[i]:
+                cursor = move_to(i)
+                out.append(lines[i] + ANSI_ERASE_TO_LINE_END)
+        # Erase the lines that there are no new lines for
+        for i in range(len(lines), len(self.lines)):
+            cursor = move_to(i)
+            out.append(ANSI_ERASE_TO_LINE_END)
+        cursor = move_to(min(len(lines), len(self.lines)))
+        # Add the new lines that there were no lines for
+        for line in lines[len(self.lines) :]:
+            out.append(line + ANSI_ERASE_TO_LINE_END + "\n")
+        self.lines = list(lines)
+        return "".join(out)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import os
+from array import array
+from typing import List, Optional
+
+import pygit2
+
+from fragmap.commitdiff import HunkTable
+
+from . import debug
+
+# Bump when the stored format or the diff options below change
+CACHE_FORMAT_VERSION = 2
+DIFF_OPTIONS = "context_lines=0,interhunk_lines=0,find_similar=1"
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def _encode(table: HunkTable) -> str:
+    return json.dumps(
+        {
+            "version": CACHE_FORMAT_VERSION,
+            "old_paths": table.old_paths,
+            "new_paths": table.new_paths,
+            "is_binary": table.is_binary.tolist(),
+            "hunk_offsets": table.hunk_offsets.tolist(),
+            "old_start": table.old_start.tolist(),
+            "old_lines": table.old_lines.tolist(),
+            "new_start": table.new_start.tolist(),
+            "new_lines": table.new_lines.tolist(),
+        },
+        separators=(",", ":"),
+    )
+
+
+def _decode(data: str) -> Optional[HunkTable]:
+    content = json.loads(data)
+    if content["version"] != CACHE_FORMAT_VERSION:
+        return None
+    return HunkTable(
+        old_paths=content["old_paths"],
+        new_paths=content["new_paths"],
+        is_binary=array("b", content["is_binary"]),
+        hunk_offsets=array("i", content["hunk_offsets"]),
+        old_start=array("i", content["old_start"]),
+        old_lines=array("i", content["old_lines"]),
+        new_start=array("i", content["new_start"]),
+        new_lines=array("i", content["new_lines"]),
+    )
+
+
+class DiffCache(object):
+    """
+    On-disk cache of the hunk ranges of commits, keyed by the trees that were
+    diffed. The diff of a commit against its first parent never changes, so
+    entries never need to be invalidated, only evicted when the cache grows
+    beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def for_repository(repo: pygit2.Repository, **kwargs):
+        return DiffCache(os.path.join(repo.path, "fragmap", "diffs"), **kwargs)
+
+    @staticmethod
+    def key(commit) -> Optional[str]:
+        # Staged and unstaged changes have no fixed trees and are not cached
+        if not isinstance(commit, pygit2.Commit) or not commit.parents:
+            return None
+        key = f"{commit.parents[0].tree_id}:{commit.tree_id}:{DIFF_OPTIONS}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def lookup(self, key: str) -> Optional[HunkTable]:
+        path = self._entry_path(key)
+        try:
+            with open(path, "r") as f:
+                table = _decode(f.read())
+            # Refresh the modification time to evict least recently used first
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return table
+
+    def store(self, key: str, table: HunkTable):
+        path = self._entry_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(_encode(table))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            debug.get("console").debug("Could not write to diff cache: %s", e)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the
+        cache is within max_bytes.
+        """
+        try:
+            entries: List[os.DirEntry] = [
+                entry
+                for entry in os.scandir(self.cache_dir)
+                if entry.name.endswith(".json")
+            ]
+            stats = [(entry.path, entry.stat()) for entry in entries]
+        except OSError:
+            return
+        total_bytes = sum([stat.st_size for _, stat in stats])
+        for path, stat in sorted(stats, key=lambda ps: ps[1].st_mtime):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= stat.st_size
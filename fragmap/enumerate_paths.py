@@ -14,51 +14,205 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from pprint import pformat
-from typing import Iterable, List
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from fragmap import debug
-from fragmap.spg import SINK, SOURCE, SPG, Node
-from fragmap.update import node_by_new
-
-
-def _all_paths_without_deduplication(
-    spg: SPG, source: Node
-) -> List[List[Node]]:
-    if source == SINK:
-        return [[SINK]]
-    paths = [
-        [source] + path
-        for end in sorted(spg.graph[source], key=node_by_new)
-        for path in _all_paths_without_deduplication(spg, end)
-    ]
-    if debug.is_logging("grouping"):
-        debug.get("grouping").debug("paths: \n%s", pformat(paths))
-    return paths
-
-
-def all_paths(spg: SPG, source=SOURCE) -> Iterable[List[Node]]:
+from fragmap.spg import SOURCE, SPG, CompactSPG, Node
+
+# A path as a linked list of node ids, from the first node to the sink. Paths
+# that share their end share the same tail.
+PathTail = Optional[Tuple[int, "PathTail"]]
+
+
+def _postorder(
+    spg: CompactSPG, source: int, is_visited: Callable[[int], bool]
+) -> List[int]:
+    # The nodes reachable from the source, each after all its successors. An
+    # explicit stack is used since paths can be longer than the recursion
+    # limit.
+    order = []
+    visited = set([source])
+    stack = [(source, iter(spg.successors(source)))]
+    while stack:
+        node, ends = stack[-1]
+        for end in ends:
+            if end not in visited and is_visited(end):
+                visited.add(end)
+                stack.append((end, iter(spg.successors(end))))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+    return order
+
+
+def _unique_paths(
+    spg: CompactSPG, source: int
+) -> Iterator[Tuple[int, PathTail]]:
+    """
+    Yield the first path in depth first order for each unique sequence of
+    active nodes from the source, with the bitset of the generations of its
+    active nodes. The paths from each node are built once from the paths of
+    its successors. Paths without active nodes are skipped.
+    """
+    # Active nodes with the same generation and spans are identical
+    canonical: Dict[Tuple, int] = {}
+    active_ids = {
+        i: canonical.setdefault(
+            (
+                spg.generation[i],
+                spg.new_start[i],
+                spg.old_start[i],
+                spg.new_end[i],
+                spg.old_end[i],
+            ),
+            len(canonical) + 1,
+        )
+        for i in spg.active_hunks.keys()
+    }
+    # Sequences of active nodes are interned as (first active node, id of the
+    # rest of the sequence), with 0 as the empty sequence. The signature of a
+    # sequence has the bits of the generations of its nodes set.
+    sequences: Dict[Tuple[int, int], int] = {}
+    signatures: Dict[int, int] = {0: 0}
+
+    def prepend(i: int, sequence: int) -> int:
+        key = (active_ids[i], sequence)
+        if key not in sequences:
+            sequences[key] = len(sequences) + 1
+            signatures[sequences[key]] = signatures[sequence] | (
+                1 << int(spg.generation[i])
+            )
+        return sequences[key]
+
+    def contributes(i: int) -> bool:
+        # Whether some path through the node has an active node
+        return spg.reaches_active[i] or spg.is_downstream_from_active[i]
+
+    order = _postorder(spg, source, contributes)
+    remaining_predecessors = {i: 0 for i in order}
+    for i in order:
+        for end in spg.successors(i):
+            if end in remaining_predecessors:
+                remaining_predecessors[end] += 1
+    paths_from: Dict[int, Dict[int, PathTail]] = {}
+
+    def merge_paths_from(
+        i: int, end: int, paths: Dict[int, PathTail]
+    ) -> List[Tuple[int, PathTail]]:
+        # Add the paths through the end to the paths from node i and return
+        # the ones that were new
+        added = []
+        is_active = i in active_ids
+        for sequence, tail in paths_from[end].items():
+            if is_active:
+                sequence = prepend(i, sequence)
+            if sequence not in paths:
+                paths[sequence] = (i, tail)
+                added.append((sequence, paths[sequence]))
+        # The paths from a node are not needed after all of its predecessors
+        # have been visited
+        remaining_predecessors[end] -= 1
+        if remaining_predecessors[end] == 0:
+            del paths_from[end]
+        return added
+
+    if source == spg.sink:
+        return
+    source_ends = spg.successors(source)
+    merged_source_ends = 0
+    paths_from_source: Dict[int, PathTail] = {}
+    for i in order[:-1]:
+        ends = spg.successors(i)
+        if not ends:
+            paths_from[i] = {0: (i, None)}
+        else:
+            paths = {}
+            for end in ends:
+                if end in remaining_predecessors:
+                    merge_paths_from(i, end, paths)
+            # The paths to the node have no active nodes either, so the
+            # paths from it without active nodes are not needed
+            if not spg.is_downstream_from_active[i]:
+                paths.pop(0, None)
+            paths_from[i] = paths
+        while merged_source_ends < len(source_ends) and (
+            source_ends[merged_source_ends] in paths_from
+            or source_ends[merged_source_ends] not in remaining_predecessors
+        ):
+            end = source_ends[merged_source_ends]
+            merged_source_ends += 1
+            if end not in remaining_predecessors:
+                continue
+            for sequence, path in merge_paths_from(
+                source, end, paths_from_source
+            ):
+                if sequence != 0:
+                    yield signatures[sequence], path
+
+
+def _to_list(path: PathTail) -> List[int]:
+    nodes = []
+    while path is not None:
+        node, path = path
+        nodes.append(node)
+    return nodes
+
+
+def all_path_signatures(
+    spg: CompactSPG, source: int
+) -> Iterable[Tuple[int, List[int]]]:
+    """
+    Like all_paths() but for node ids, and each path comes with a bitset
+    where bit g is set if the path has an active node in generation g.
+    """
+    for signature, path in _unique_paths(spg, source):
+        path = _to_list(path)
+        if debug.is_logging("grouping"):
+            debug.get("grouping").debug("path: \n%s", pformat(path))
+        yield signature, path
+
+
+def all_paths(
+    spg: Union[SPG, CompactSPG], source=SOURCE
+) -> Iterable[List[Node]]:
     """
     Enumerates all paths through the SPG. All inactive nodes are treated as
     idential and identical paths are skipped, so all returned paths will have a
-    unique set of visited active nodes.
+    unique set of visited active nodes. Paths without any active node are
+    skipped. The paths are generated lazily, in depth first order with the
+    ends of each node ordered by node_by_new().
     """
+    if isinstance(spg, SPG):
+        spg = CompactSPG.from_spg(spg)
+    source_id = spg.source if source == SOURCE else spg.node_id(source)
+    for _, path in all_path_signatures(spg, source_id):
+        yield [spg.node(i) for i in path]
 
-    def path_key_ignoring_inactive(path: List[Node]):
-        return tuple(
-            [
-                (
-                    tuple([node.generation, node_by_new(node)])
-                    if node.is_active
-                    else tuple()
-                )
-                for node in path
-            ]
-        )
 
-    paths = _all_paths_without_deduplication(spg, source)
-    known_keys = set()
-    for path in paths:
-        k = path_key_ignoring_inactive(path)
-        if k not in known_keys:
-            known_keys.add(k)
-            yield path
+def with_unchanged_generations(path: List[Node], generations: int):
+    """
+    Insert the nodes of the generations that were skipped in the graph because
+    the file was unchanged in them, so that the path has one node for each of
+    the given number of generations, in addition to the source and sink.
+    """
+    expanded = []
+    for node in path:
+        if expanded:
+            prev_node = expanded[-1]
+            for generation in range(
+                prev_node.generation + 1, min(node.generation, generations)
+            ):
+                prev_node = Node.propagated(prev_node, generation)
+                expanded.append(prev_node)
+        expanded.append(node)
+    return expanded
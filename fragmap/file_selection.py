@@ -13,38 +13,139 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from dataclasses import dataclass
-from pathlib import Path, PurePath
-from typing import Dict, List, Union
 
-from fragmap.list_dict import ListDict
+# To be able to use the enclosing class type in class method type hints
+from __future__ import annotations
+
+import glob
+import os
+import re
+from dataclasses import dataclass, field
+from fnmatch import translate
+from pathlib import PurePath
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+from fragmap.renames import RenameIndex
 from fragmap.spg import FileId
 
+GLOB_CHARACTERS = re.compile(r"[*?[]")
+
+
+# Nodes are compared by identity
+@dataclass(eq=False)
+class PatternTrie:
+    """
+    A prefix tree of the path components of a set of patterns. A path matches
+    if some pattern matches a prefix of its components, so a directory
+    matches the files in it. A component can be a glob, matched with fnmatch,
+    and a "**" component matches any number of components.
+    """
+
+    children: Dict[str, PatternTrie] = field(default_factory=lambda: {})
+    globs: List[Tuple[Pattern, PatternTrie]] = field(default_factory=lambda: [])
+    any_depth: Optional[PatternTrie] = None
+    # Whether a pattern ends here
+    is_end: bool = False
+    # Whether this is the node after a "**" component, which stays here for
+    # each further component
+    repeats: bool = False
+
+    @staticmethod
+    def from_patterns(patterns: List[PurePath]) -> PatternTrie:
+        trie = PatternTrie()
+        for pattern in patterns:
+            trie.add(pattern.parts)
+        return trie
+
+    def add(self, parts: Tuple[str, ...]):
+        node = self
+        for part in parts:
+            node = node._child(part)
+        node.is_end = True
+
+    def _child(self, part: str) -> PatternTrie:
+        if part == "**":
+            if self.any_depth is None:
+                self.any_depth = PatternTrie(repeats=True)
+            return self.any_depth
+        if not GLOB_CHARACTERS.search(part):
+            return self.children.setdefault(part, PatternTrie())
+        regex = re.compile(translate(part))
+        for glob, child in self.globs:
+            if glob.pattern == regex.pattern:
+                return child
+        child = PatternTrie()
+        self.globs.append((regex, child))
+        return child
 
-def file_matches(path: PurePath, pattern: PurePath):
-    if path.parent == path:
-        return path == pattern
-    else:
-        return path == pattern or file_matches(path.parent, pattern)
+    def _closure(self, nodes: List[PatternTrie]) -> List[PatternTrie]:
+        # Add the nodes reached by letting "**" match zero components
+        closed = []
+        for node in nodes:
+            while node is not None and node not in closed:
+                closed.append(node)
+                node = node.any_depth
+        return closed
+
+    def matches(self, parts: Tuple[str, ...]) -> bool:
+        nodes = self._closure([self])
+        for part in parts:
+            if any([node.is_end for node in nodes]):
+                return True
+            reached = []
+            for node in nodes:
+                if node.repeats:
+                    reached.append(node)
+                child = node.children.get(part)
+                if child is not None:
+                    reached.append(child)
+                reached.extend(
+                    [child for glob, child in node.globs if glob.match(part)]
+                )
+            nodes = self._closure(reached)
+            if not nodes:
+                return False
+        return any([node.is_end for node in nodes])
 
 
 @dataclass
 class FilePatterns:
     patterns: Union[List[PurePath], None]
+    _trie: Optional[PatternTrie] = field(
+        init=False, repr=False, compare=False, default=None
+    )
+
+    def __post_init__(self):
+        if self.patterns is not None:
+            self._trie = PatternTrie.from_patterns(self.patterns)
 
     @staticmethod
     def from_files_arg(files_arg: Union[List[str], None], cwd: str = "."):
+        """
+        Make patterns of the given paths and globs. The glob characters in the
+        path of a file that exists are matched literally. Other paths can
+        match the characters literally by escaping them as [*], [?] and [[].
+        """
+        if files_arg is None:
+            return FilePatterns(None)
         return FilePatterns(
-            None if files_arg is None else [PurePath(cwd, p) for p in files_arg]
+            [
+                PurePath(
+                    cwd,
+                    (
+                        glob.escape(p)
+                        if os.path.lexists(os.path.join(cwd, p))
+                        else p
+                    ),
+                )
+                for p in files_arg
+            ]
         )
 
     def matches(self, absolute_file: str):
         if self.patterns is None:
             return True
-        abs_file = Path(absolute_file)
-        return any(
-            [file_matches(abs_file, pattern) for pattern in self.patterns]
-        )
+        return self._trie.matches(PurePath(absolute_file).parts)
 
 
 @dataclass
@@ -55,13 +156,36 @@ class FileSelection:
     def from_files_arg(files_arg: Union[List[str], None]):
         return FileSelection(FilePatterns.from_files_arg(files_arg))
 
-    def contains(self, file_id: FileId, to_earlier_file: Dict[FileId, FileId]):
+    def contains(self, file_id: FileId, renames: RenameIndex):
         if self.patterns.patterns is None:
             return True
-        grouped_by_orig_file = ListDict()
-        for key in to_earlier_file.keys():
-            grouped_by_orig_file.add(to_earlier_file[key], key)
+        return any(
+            [self.patterns.matches(path) for path in renames.paths(file_id)]
+        )
 
-        group = grouped_by_orig_file.kv_map[to_earlier_file[file_id]]
-        assert file_id in group
-        return any([self.patterns.matches(f.path) for f in group])
+    def select_patches(
+        self, paths_per_diff: List[List[Tuple[str, str]]]
+    ) -> List[List[bool]]:
+        """
+        Decide which file patches of a series of diffs are needed to show the
+        selected files, given the old and new path of each patch. Renames are
+        followed the same way as when the graphs are built, so a patch is kept
+        exactly when contains() would select the graph it ends up in.
+        """
+        if self.patterns.patterns is None:
+            return [[True] * len(paths) for paths in paths_per_diff]
+        renames = RenameIndex()
+        originals_per_diff = [
+            renames.update(paths)[1] for paths in paths_per_diff
+        ]
+        selected = set(
+            [
+                original
+                for original in renames.originals()
+                if self.contains(original, renames)
+            ]
+        )
+        return [
+            [original in selected for original in originals]
+            for originals in originals_per_diff
+        ]
@@ -13,11 +13,26 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+# To be able to use the enclosing class type in class method type hints
+from __future__ import annotations
+
 import collections
-from dataclasses import dataclass
+import collections.abc
+from dataclasses import dataclass, field
 from enum import Enum
-from pprint import pformat, pprint
-from typing import Dict, Generic, Iterable, List, Optional, Set, TypeVar
+from pprint import pformat
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from . import debug
 from .commitdiff import CommitDiff
@@ -30,11 +45,10 @@ from .console_color import (
     ANSI_RESET,
 )
 from .datastructure_util import flatten, lzip
-from .enumerate_paths import all_paths
+from .enumerate_paths import all_path_signatures, with_unchanged_generations
 from .file_selection import FileSelection
-from .list_dict import StableListDict
-from .spg import SPG, Node
-from .update import FileId, update_commit_diff
+from .spg import CompactSPG, Node
+from .update import FileId, SPGBuilder
 
 # Hierarchy:
 # AST
@@ -67,6 +81,7 @@ from .update import FileId, update_commit_diff
 
 
 CellType = TypeVar("CellType", covariant=True)
+Product = TypeVar("Product")
 
 
 class Matrix(Generic[CellType], List[List[CellType]]):
@@ -157,25 +172,34 @@ class MultiNodeCell(Cell):
         return not (self == other)
 
 
-def changes_at_row(m: RowMajorMatrix[Cell], r: int) -> Set[int]:
-    if n_rows(m) == 0:
-        return set([])
-    n_cols = len(m[0])
-    return set([c for c in range(n_cols) if m[r][c].kind == CellKind.CHANGE])
-
-
-def collisions_between(m: RowMajorMatrix[Cell], row: int, earlier_row: int):
-    changed_at_end_row = changes_at_row(m, row)
-    for row_i in range(earlier_row + 1, row):
-        if changes_at_row(m, row_i) & changed_at_end_row:
-            return True
-    return False
+def changes_by_row(m: Union[RowMajorMatrix[Cell], KindMatrix]) -> List[int]:
+    """
+    Return the columns with changes on each row, as bitsets where bit c is set
+    if there is a change in column c.
+    """
+    if isinstance(m, KindMatrix):
+        return m.changes_by_row()
+    return [
+        # Parsed from a string of binary digits, with the last column first
+        int(
+            "0"
+            + "".join(
+                [
+                    "1" if cell.kind == CellKind.CHANGE else "0"
+                    for cell in reversed(row)
+                ]
+            ),
+            2,
+        )
+        for row in m
+    ]
 
 
-def is_subset_of_earlier(m: RowMajorMatrix[Cell], row: int, earlier_row: int):
-    changed_at_end_row = changes_at_row(m, row)
-    changed_at_earlier_row = changes_at_row(m, earlier_row)
-    return not (changed_at_end_row - changed_at_earlier_row)
+def bit_indices(bits: int) -> Iterable[int]:
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
 
 
 @dataclass
@@ -184,7 +208,9 @@ class SquashablePair:
     row: int
 
 
-def find_squashable(m: RowMajorMatrix[Cell]) -> Iterable[SquashablePair]:
+def find_squashable(
+    m: Union[RowMajorMatrix[Cell], KindMatrix],
+) -> Iterable[SquashablePair]:
     """
     Find pairs of squashable commits.
     Squashable in this case means:
@@ -193,58 +219,23 @@ def find_squashable(m: RowMajorMatrix[Cell]) -> Iterable[SquashablePair]:
         the lines that changes in the earlier commit.
     Assumes the matrix has already been decorated with BETWEEN_CHANGES.
     """
-    for r in range(n_rows(m)):
-        for earlier_r in reversed(range(r)):
-            if collisions_between(m, r, earlier_r):
-                break
-            if is_subset_of_earlier(m, r, earlier_r):
-                yield SquashablePair(earlier_row=earlier_r, row=r)
+    return squashable_pairs(changes_by_row(m))
 
 
-def mark_squashable(
-    m: RowMajorMatrix[Cell], squashable_pairs: Iterable[SquashablePair]
-):
+def squashable_pairs(changes: List[int]) -> Iterable[SquashablePair]:
     """
-    Mark cells between squashable changes.
-    See :py:func: find_squashable
+    Like find_squashable() but for the bitsets of the columns with changes on
+    each row, see changes_by_row().
     """
-    for pair in squashable_pairs:
-        changes = changes_at_row(m, pair.row)
-        for r_to_mark in range(pair.earlier_row + 1, pair.row):
-            for c in changes:
-                if m[r_to_mark][c].kind == CellKind.BETWEEN_CHANGES:
-                    m[r_to_mark][c].kind = CellKind.BETWEEN_SQUASHABLE
-
-
-def mark_cells_between_changes(m: RowMajorMatrix[Cell]):
-    if n_rows(m) == 0:
-        return m
-    n_cols = len(m[0])
-    # Mark dots between conflicts
-    last_patch = [-1] * n_cols
-    for r in range(n_rows(m)):
-        for c in range(n_cols):
-            cell = m[r][c]
-            if cell.kind == CellKind.CHANGE:
-                if debug.is_logging("grid"):
-                    debug.get("grid").debug(
-                        "last_patch %s %s %s", last_patch[c], c, r
-                    )
-                if last_patch[c] >= 0:
-                    # Mark the cells inbetween
-                    start = last_patch[c]
-                    end = r
-                    for i in range(start, end + 1):
-                        # If not yet decorated
-                        if m[i][c].kind == CellKind.NO_CHANGE:
-                            m[i][c].kind = CellKind.BETWEEN_CHANGES
-                last_patch[c] = r
-
-
-def decorate_matrix(m: RowMajorMatrix[Cell]):
-    debug.get("grid").debug("decorate_matrix")
-    mark_cells_between_changes(m)
-    mark_squashable(m, find_squashable(m))
+    for r in range(len(changes)):
+        # The changes of the rows between earlier_r and r
+        changes_between = 0
+        for earlier_r in reversed(range(r)):
+            if changes_between & changes[r]:
+                break
+            if not changes[r] & ~changes[earlier_r]:
+                yield SquashablePair(earlier_row=earlier_r, row=r)
+            changes_between |= changes[earlier_r]
 
 
 class ConnectionStatus(object):
@@ -303,53 +294,528 @@ class GraphPath:
     file_id: FileId
 
 
+# Translation tables between cell kinds and bytes of a KindMatrix
+CHANGE_BYTE = bytes([CellKind.CHANGE.value])
+NO_CHANGE_BYTE = bytes([CellKind.NO_CHANGE.value])
+BETWEEN_CHANGES_FROM_NO_CHANGE = bytes(
+    [
+        CellKind.BETWEEN_CHANGES.value if b == CellKind.NO_CHANGE.value else b
+        for b in range(256)
+    ]
+)
+
+
+def binary_digit_if(kinds: Iterable[CellKind]) -> bytes:
+    values = [kind.value for kind in kinds]
+    return bytes([ord("1") if b in values else ord("0") for b in range(256)])
+
+
+BINARY_DIGIT_IF_CHANGE = binary_digit_if([CellKind.CHANGE])
+
+
+@dataclass
+class KindMatrix:
+    """
+    A matrix of cell kinds stored as one byte per cell, with parallel tables
+    of the node and file of each cell. Like a NumPy array, the matrix is a
+    strided view of its storage, so transposing it or selecting rows from it
+    does not copy anything. Cells can be created from it with cell() when the
+    Cell interface is needed.
+    """
+
+    kinds: bytearray
+    nodes: List[Node]
+    file_ids: List[FileId]
+    n_rows: int
+    n_columns: int
+    row_stride: int
+    column_stride: int
+    offset: int = 0
+
+    @staticmethod
+    def from_columns(paths: List[GraphPath]) -> KindMatrix:
+        # The nodes of each path are stored after each other, so the storage
+        # is column major
+        rows = len(paths[0].nodes) if paths else 0
+        kinds = bytearray()
+        nodes = []
+        file_ids = []
+        for path in paths:
+            kinds.extend(
+                [
+                    (
+                        CellKind.CHANGE.value
+                        if node.is_active
+                        else CellKind.NO_CHANGE.value
+                    )
+                    for node in path.nodes
+                ]
+            )
+            nodes.extend(path.nodes)
+            file_ids.extend([path.file_id] * len(path.nodes))
+        return KindMatrix(
+            kinds,
+            nodes,
+            file_ids,
+            n_rows=rows,
+            n_columns=len(paths),
+            row_stride=1,
+            column_stride=rows,
+        )
+
+    @staticmethod
+    def from_cells(m: RowMajorMatrix[SingleNodeCell]) -> KindMatrix:
+        columns = len(m[0]) if m else 0
+        return KindMatrix(
+            bytearray([cell.kind.value for row in m for cell in row]),
+            [cell.node for row in m for cell in row],
+            [cell.file_id for row in m for cell in row],
+            n_rows=len(m),
+            n_columns=columns,
+            row_stride=columns,
+            column_stride=1,
+        )
+
+    def __len__(self):
+        return self.n_rows
+
+    def _index(self, r: int, c: int) -> int:
+        return self.offset + r * self.row_stride + c * self.column_stride
+
+    def kind(self, r: int, c: int) -> CellKind:
+        return CellKind(self.kinds[self._index(r, c)])
+
+    def set_kind(self, r: int, c: int, kind: CellKind):
+        self.kinds[self._index(r, c)] = kind.value
+
+    def node(self, r: int, c: int) -> Node:
+        return self.nodes[self._index(r, c)]
+
+    def file_id(self, r: int, c: int) -> FileId:
+        return self.file_ids[self._index(r, c)]
+
+    def cell(self, r: int, c: int) -> SingleNodeCell:
+        return SingleNodeCell(
+            self.kind(r, c), self.file_id(r, c), self.node(r, c)
+        )
+
+    def transposed(self) -> KindMatrix:
+        return KindMatrix(
+            self.kinds,
+            self.nodes,
+            self.file_ids,
+            n_rows=self.n_columns,
+            n_columns=self.n_rows,
+            row_stride=self.column_stride,
+            column_stride=self.row_stride,
+            offset=self.offset,
+        )
+
+    def row_range(self, start: int, stop: int) -> KindMatrix:
+        n_rows = max(0, stop - start)
+        return KindMatrix(
+            self.kinds,
+            self.nodes,
+            self.file_ids,
+            n_rows=n_rows,
+            n_columns=self.n_columns if n_rows else 0,
+            row_stride=self.row_stride,
+            column_stride=self.column_stride,
+            offset=self._index(start, 0) if n_rows else 0,
+        )
+
+    def column_range(self, start: int, stop: int) -> KindMatrix:
+        return self.transposed().row_range(start, stop).transposed()
+
+    def _line_slice(self, start: int, count: int, stride: int) -> slice:
+        return slice(start, start + (count - 1) * stride + 1, stride)
+
+    def row(self, r: int) -> bytearray:
+        if not self.n_columns:
+            return bytearray()
+        return self.kinds[
+            self._line_slice(
+                self._index(r, 0), self.n_columns, self.column_stride
+            )
+        ]
+
+    def column(self, c: int) -> bytearray:
+        if not self.n_rows:
+            return bytearray()
+        return self.kinds[
+            self._line_slice(self._index(0, c), self.n_rows, self.row_stride)
+        ]
+
+    def set_column(self, c: int, start_row: int, kinds: bytes):
+        if kinds:
+            self.kinds[
+                self._line_slice(
+                    self._index(start_row, c), len(kinds), self.row_stride
+                )
+            ] = kinds
+
+    def distinct_columns(self) -> List[int]:
+        """
+        Return the columns that are kept when equal neighboring columns are
+        merged and columns without changes are left out. The first column is
+        always kept.
+        """
+        distinct = []
+        for c in range(self.n_columns):
+            column = self.column(c)
+            if distinct and (
+                column == self.column(distinct[-1])
+                or not column.strip(NO_CHANGE_BYTE)
+            ):
+                continue
+            distinct.append(c)
+        return distinct
+
+    def row_nodes(self, r: int) -> List[Node]:
+        if not self.n_columns:
+            return []
+        return self.nodes[
+            self._line_slice(
+                self._index(r, 0), self.n_columns, self.column_stride
+            )
+        ]
+
+    def row_bitsets(self, binary_digits: bytes) -> List[int]:
+        """
+        Return a bitset for each row where bit c is set if the translation
+        table maps the kind of column c to "1", see binary_digit_if().
+        """
+        # Bit c of a row is the last digit of the reversed row
+        return [
+            int(b"0" + self.row(r)[::-1].translate(binary_digits), 2)
+            for r in range(self.n_rows)
+        ]
+
+    def changes_by_row(self) -> List[int]:
+        return self.row_bitsets(BINARY_DIGIT_IF_CHANGE)
+
+    def mark_cells_between_changes(self):
+        # Everything between the first and last change of a column is between
+        # changes
+        for c in range(self.n_columns):
+            column = self.column(c)
+            first = column.find(CHANGE_BYTE)
+            if first < 0:
+                continue
+            last = column.rfind(CHANGE_BYTE)
+            self.set_column(
+                c,
+                first,
+                column[first : last + 1].translate(
+                    BETWEEN_CHANGES_FROM_NO_CHANGE
+                ),
+            )
+
+    def mark_squashable(self, squashable_pairs: Iterable[SquashablePair]):
+        """
+        Mark the cells between the changes of each pair of squashable rows,
+        see find_squashable().
+        """
+        changes = self.changes_by_row()
+        for pair in squashable_pairs:
+            columns = list(bit_indices(changes[pair.row]))
+            for r_to_mark in range(pair.earlier_row + 1, pair.row):
+                for c in columns:
+                    if self.kind(r_to_mark, c) == CellKind.BETWEEN_CHANGES:
+                        self.set_kind(r_to_mark, c, CellKind.BETWEEN_SQUASHABLE)
+
+    def decorate(self):
+        """
+        Mark the cells between changes and between squashable changes.
+        """
+        debug.get("grid").debug("decorate")
+        self.mark_cells_between_changes()
+        self.mark_squashable(find_squashable(self))
+
+
+@dataclass(frozen=True)
+class Viewport:
+    """
+    The window of rows and columns of a matrix to render. None means no limit
+    on the number of rows or columns.
+    """
+
+    row_offset: int = 0
+    column_offset: int = 0
+    max_rows: Optional[int] = None
+    max_columns: Optional[int] = None
+
+    def rows(self, n_rows: int) -> range:
+        return _window(self.row_offset, self.max_rows, n_rows)
+
+    def columns(self, n_columns: int) -> range:
+        return _window(self.column_offset, self.max_columns, n_columns)
+
+
+def _window(offset: int, limit: Optional[int], n: int) -> range:
+    start = min(max(0, offset), n)
+    if limit is None:
+        return range(start, n)
+    return range(start, min(n, start + max(0, limit)))
+
+
+def render_kinds_for_console(
+    matrix: KindMatrix,
+    colorize: bool,
+    viewport: Viewport = Viewport(),
+    columns: Optional[List[int]] = None,
+) -> RowMajorMatrix[str]:
+    """
+    Render the cells of the matrix in the viewport, and only those. If the
+    columns of the matrix to show are given, the viewport is a window of
+    those.
+    """
+    if colorize:
+        rendered = {
+            # Make background white
+            CellKind.CHANGE: ANSI_BG_WHITE + " " + ANSI_RESET,
+            # Make background red
+            CellKind.BETWEEN_CHANGES: ANSI_BG_RED + " " + ANSI_RESET,
+            # Make background yellow
+            CellKind.BETWEEN_SQUASHABLE: ANSI_BG_DARK_YELLOW + " " + ANSI_RESET,
+            CellKind.NO_CHANGE: ".",
+        }
+    else:
+        rendered = {
+            CellKind.CHANGE: "#",
+            CellKind.BETWEEN_CHANGES: "|",
+            CellKind.BETWEEN_SQUASHABLE: "^",
+            CellKind.NO_CHANGE: ".",
+        }
+    by_byte = {kind.value: string for kind, string in rendered.items()}
+    rows = viewport.rows(matrix.n_rows)
+    if columns is not None:
+        shown = [columns[c] for c in viewport.columns(len(columns))]
+        return RowMajorMatrix(
+            [
+                [by_byte[matrix.kinds[matrix._index(r, c)]] for c in shown]
+                for r in rows
+            ]
+        )
+    window_columns = viewport.columns(matrix.n_columns)
+    window = matrix.row_range(rows.start, rows.stop).column_range(
+        window_columns.start, window_columns.stop
+    )
+    return RowMajorMatrix(
+        [
+            [by_byte[kind] for kind in window.row(r)]
+            for r in range(n_rows(window))
+        ]
+    )
+
+
+# The signature of a column and the file, graph and node ids of its path, see
+# Fragmap.signed_paths()
+SignedPath = Tuple[int, FileId, CompactSPG, List[int]]
+
+
 @dataclass
-class Fragmap:
+class LazyKindMatrix:
+    """
+    The merged columns of a kind matrix, see KindMatrix.distinct_columns(),
+    where the kinds are only generated for the blocks of columns that are
+    asked for. A decorated column only depends on the generations where it
+    changes and on the squashable pairs of rows, and the pairs only depend on
+    the generations where each column changes. So the signatures of the paths
+    are enough to merge the columns and to find the squashable rows. Each
+    block has all rows since the cells between changes depend on the whole
+    column.
+    """
+
+    n_rows: int
+    paths: List[SignedPath]
+    graph_path: Callable[[FileId, CompactSPG, List[int]], GraphPath]
+    squashable: List[SquashablePair]
+    block_columns: int = 256
+    _blocks: Dict[int, KindMatrix] = field(default_factory=dict, repr=False)
+
+    @staticmethod
+    def from_signed_paths(
+        signed_paths: Iterable[SignedPath],
+        n_rows: int,
+        graph_path: Callable[[FileId, CompactSPG, List[int]], GraphPath],
+        block_columns: int = 256,
+    ) -> LazyKindMatrix:
+        # Equal columns have equal signatures and columns without changes
+        # have none
+        paths = []
+        for signed_path in signed_paths:
+            signature = signed_path[0]
+            if paths and (signature == paths[-1][0] or not signature):
+                continue
+            paths.append(signed_path)
+        changes = [0] * n_rows
+        for c, (signature, _, _, _) in enumerate(paths):
+            for r in bit_indices(signature):
+                changes[r] |= 1 << c
+        return LazyKindMatrix(
+            n_rows,
+            paths,
+            graph_path,
+            list(squashable_pairs(changes)),
+            block_columns,
+        )
+
+    @property
+    def n_columns(self) -> int:
+        return len(self.paths)
+
+    def _block(self, b: int) -> KindMatrix:
+        if b not in self._blocks:
+            start = b * self.block_columns
+            stop = min(start + self.block_columns, self.n_columns)
+            columns = KindMatrix.from_columns(
+                [
+                    self.graph_path(file_id, spg, path)
+                    for _, file_id, spg, path in self.paths[start:stop]
+                ]
+            )
+            # Leave out the source and sink
+            m = columns.row_range(1, columns.n_rows - 1)
+            m.mark_cells_between_changes()
+            m.mark_squashable(self.squashable)
+            self._blocks[b] = m
+        return self._blocks[b]
+
+    def file_id(self, c: int) -> FileId:
+        return self.paths[c][1]
+
+    def cell(self, r: int, c: int) -> SingleNodeCell:
+        return self._block(c // self.block_columns).cell(
+            r, c % self.block_columns
+        )
+
+    def render_for_console(
+        self, colorize, viewport: Viewport = Viewport()
+    ) -> RowMajorMatrix[str]:
+        """
+        Render the cells in the viewport, after generating the blocks of
+        columns it overlaps.
+        """
+        rows = viewport.rows(self.n_rows)
+        columns = viewport.columns(self.n_columns)
+        rendered = RowMajorMatrix([[] for _ in rows])
+        start = columns.start
+        while start < columns.stop:
+            b = start // self.block_columns
+            stop = min((b + 1) * self.block_columns, columns.stop)
+            block_viewport = Viewport(
+                rows.start,
+                start - b * self.block_columns,
+                len(rows),
+                stop - start,
+            )
+            for row, block_row in zip(
+                rendered,
+                render_kinds_for_console(
+                    self._block(b), colorize, block_viewport
+                ),
+            ):
+                row.extend(block_row)
+            start = stop
+        return rendered
+
+
+class CachedProducts(object):
+    """
+    Keeps what a fragmap generates, like its matrix, after it is first
+    generated, so that all consumers share it. The products are kept for as
+    long as the fragmap lives. Fragmaps do not change once built, so live
+    mode builds new ones to show new diffs.
+    """
+
+    def _cached(self, name: str, generate: Callable[[], Product]) -> Product:
+        products = self.__dict__.setdefault("_products", {})
+        if name not in products:
+            products[name] = generate()
+        return products[name]
+
+
+@dataclass
+class Fragmap(CachedProducts):
     _patches: List[CommitDiff]
-    spgs: Dict[FileId, SPG]
+    spgs: Dict[FileId, CompactSPG]
 
     @staticmethod
     def from_diffs(
-        diffs: List[CommitDiff], files_arg: Optional[List[str]] = None
+        diffs: List[CommitDiff],
+        files_arg: Optional[List[str]] = None,
+        builder: Optional[SPGBuilder] = None,
     ):
-        files = {}
-        spgs = {}
-        for i, diff in enumerate(diffs):
-            update_commit_diff(spgs, files, diff, i)
-            if debug.is_logging("update"):
-                for file_id, spg in spgs.items():
-                    debug.get("update").debug(spg.to_dot(file_id))
-                debug.get("update").debug("-------")
+        """
+        Build the fragmap of the diffs. Pass the same builder again to reuse
+        the SPGs of the diffs that are unchanged since the previous build.
+        """
+        if builder is None:
+            builder = SPGBuilder()
+        builder.build(diffs)
 
         selected_files = FileSelection.from_files_arg(files_arg)
         selected_file_spgs = {
-            file_id: spg
-            for file_id, spg in spgs.items()
-            if selected_files.contains(file_id, files)
+            file_id: CompactSPG.from_spg(spg)
+            for file_id, spg in builder.spgs.items()
+            if selected_files.contains(file_id, builder.renames)
         }
         return Fragmap(diffs, selected_file_spgs)
 
     def patches(self):
         return self._patches
 
-    def paths(self) -> List[GraphPath]:
-        return [
-            GraphPath(path, file_id)
-            # Sort by file
-            for file_id, spg in sorted(
-                self.spgs.items(), key=lambda kv: kv[0].tuple()
-            )
-            for path in all_paths(spg)
-        ]
+    def paths(self) -> Iterable[GraphPath]:
+        return (
+            self._graph_path(file_id, spg, path)
+            for _, file_id, spg, path in self.signed_paths()
+        )
 
-    def _generate_columns(self) -> ColumnMajorMatrix:
-        paths = self.paths()
-        # Remove empty columns
-        paths = [
-            path
-            for path in paths
-            if any([node.is_active for node in path.nodes])
-        ]
+    def signed_paths(self) -> Iterable[SignedPath]:
+        """
+        Generate the node ids of the path of each column, with the bitset of
+        the generations where the column has a change and the file and graph
+        of the path.
+        """
+        # Sort by file
+        for file_id, spg in sorted(
+            self.spgs.items(), key=lambda kv: kv[0].tuple()
+        ):
+            for signature, path in all_path_signatures(spg, spg.source):
+                yield signature, file_id, spg, path
+
+    def signed_columns(self) -> Iterable[SignedPath]:
+        """
+        Generate the signed paths of the columns of the matrix.
+        """
+        return self.signed_paths()
+
+    def _graph_path(self, file_id: FileId, spg: CompactSPG, path: List[int]):
+        return GraphPath(
+            with_unchanged_generations(
+                [spg.node(i) for i in path], len(self._patches)
+            ),
+            file_id,
+        )
+
+    def generate_kind_matrix(self) -> KindMatrix:
+        return self._cached("kind_matrix", self._generate_kind_matrix)
+
+    def generate_matrix(self) -> RowMajorMatrix:
+        return self._cached("matrix", self._generate_matrix)
+
+    def generate_lazy_kind_matrix(self) -> LazyKindMatrix:
+        return self._cached(
+            "lazy_kind_matrix",
+            lambda: LazyKindMatrix.from_signed_paths(
+                self.signed_columns(), len(self._patches), self._graph_path
+            ),
+        )
+
+    def _generate_kind_matrix(self) -> KindMatrix:
+        # The paths all have active nodes, so there are no empty columns
+        paths = list(self.paths())
         if paths:
             # All columns should be equally long
             if 1 != len(list(set([len(col.nodes) for col in paths]))):
@@ -357,301 +823,244 @@ class Fragmap:
                     "All columns are not equally long: \n %s", pformat(paths)
                 )
                 assert False
-        return ColumnMajorMatrix(
+        columns = KindMatrix.from_columns(paths)
+        # Leave out the source and sink
+        m = columns.row_range(1, columns.n_rows - 1)
+        m.decorate()
+        return m
+
+    def _generate_matrix(self) -> RowMajorMatrix:
+        m = self.generate_kind_matrix()
+        return RowMajorMatrix(
             [
-                [
-                    SingleNodeCell(
-                        (
-                            CellKind.CHANGE
-                            if node.is_active
-                            else CellKind.NO_CHANGE
-                        ),
-                        path.file_id,
-                        node,
-                    )
-                    for node in path.nodes
-                ]
-                for path in paths
+                [m.cell(r, c) for c in range(m.n_columns)]
+                for r in range(m.n_rows)
             ]
         )
 
-    def generate_matrix(self) -> RowMajorMatrix:
-        columns = self._generate_columns()
-        rows = columns.row_major()
-        m = RowMajorMatrix(rows[1:-1])
-        decorate_matrix(m)
-        return m
-
-    def render_for_console(self, colorize) -> RowMajorMatrix[str]:
-        return self._render_for_console(self.generate_matrix(), colorize)
-
-    def _render_for_console(
-        self, matrix: RowMajorMatrix[Cell], colorize: bool
+    def render_for_console(
+        self, colorize, viewport: Viewport = Viewport()
     ) -> RowMajorMatrix[str]:
-        if n_rows(matrix) == 0:
-            return RowMajorMatrix([])
-        n_cols = len(matrix[0])
-        m = RowMajorMatrix(
-            [["." for _ in range(n_cols)] for _ in range(n_rows(matrix))]
+        return render_kinds_for_console(
+            self.generate_kind_matrix(), colorize, viewport
         )
 
-        def render_cell(cell: SingleNodeCell):
-            if cell.kind == CellKind.CHANGE:
-                if colorize:
-                    # Make background white
-                    return ANSI_BG_WHITE + " " + ANSI_RESET
-                else:
-                    return "#"
-            if cell.kind == CellKind.BETWEEN_CHANGES:
-                if colorize:
-                    # Make background red
-                    return ANSI_BG_RED + " " + ANSI_RESET
-                else:
-                    return "|"
-            if cell.kind == CellKind.BETWEEN_SQUASHABLE:
-                if colorize:
-                    # Make background yellow
-                    return ANSI_BG_DARK_YELLOW + " " + ANSI_RESET
-                else:
-                    return "^"
-            if cell.kind == CellKind.NO_CHANGE:
-                return "."
-            assert False, f"Unexpected cell kind: {cell.kind}"
-
-        for r in range(n_rows(matrix)):
-            for c in range(n_cols):
-                m[r][c] = render_cell(matrix[r][c])
-        return m
-
     def str(self):
         matrix = self.generate_matrix()
         return "\n".join(["".join(row) for row in matrix])
 
 
 @dataclass
-class BriefFragmap:
+class BriefFragmap(CachedProducts):
     inner: Fragmap
 
     def patches(self):
         return self.inner.patches()
 
-    def generate_matrix(self) -> RowMajorMatrix:
-        full_matrix = self.inner.generate_matrix()
-        return BriefFragmap._group_by_patch_connection(
-            full_matrix.column_major()
-        ).row_major()
-
-    @staticmethod
-    def _group_by_patch_connection(
-        columns: ColumnMajorMatrix[SingleNodeCell],
-    ) -> ColumnMajorMatrix:
-        def connection(column: List[Cell]):
-            return "".join(
-                ["1" if r.kind == CellKind.CHANGE else "0" for r in column]
-            )
+    def generate_kind_matrix(self) -> KindMatrix:
+        return self._cached("kind_matrix", self._generate_kind_matrix)
 
-        def groupby(l: List[List[Cell]], key) -> List[List[List[Cell]]]:
-            d = StableListDict()
-            for item in l:
-                d.add(key(item), item)
-            return [values for k, values in d.items()]
+    def generate_matrix(self) -> RowMajorMatrix:
+        return self._cached("matrix", self._generate_matrix)
+
+    def generate_lazy_kind_matrix(self) -> LazyKindMatrix:
+        return self._cached(
+            "lazy_kind_matrix",
+            lambda: LazyKindMatrix.from_signed_paths(
+                self.signed_columns(),
+                len(self.patches()),
+                self.inner._graph_path,
+            ),
+        )
 
-        column_groups = ColumnMajorMatrix(groupby(columns, key=connection))
+    def signed_columns(self) -> Iterable[SignedPath]:
+        """
+        Generate the signed paths of the columns of the matrix. Columns that
+        change in the same generations are grouped, so only the first column
+        of each group is needed, and its nodes are the nodes of the cells.
+        """
+        signatures = set()
+        for signed_path in self.inner.signed_paths():
+            if signed_path[0] not in signatures:
+                signatures.add(signed_path[0])
+                yield signed_path
+
+    def _generate_kind_matrix(self) -> KindMatrix:
+        # Grouping does not change how the cells are decorated, so that is
+        # done after grouping
+        groups = [
+            self.inner._graph_path(file_id, spg, path)
+            for _, file_id, spg, path in self.signed_columns()
+        ]
         if debug.is_logging("matrix"):
-            debug.get("matrix").debug(
-                "grouped columns: %s", pformat(column_groups)
-            )
-
-        def multi_cell_kind(cells: List[Cell]):
-            kinds = list(set([cell.kind for cell in cells]))
-            if len(kinds) != 1:
-                print("Cells have different kinds:", kinds)
-                pprint(cells)
-                assert False
-            return kinds[0]
-
-        def transpose(list_of_lists):
-            return list(zip(*list_of_lists))
+            debug.get("matrix").debug("grouped columns: %s", pformat(groups))
+        columns = KindMatrix.from_columns(groups)
+        m = columns.row_range(1, columns.n_rows - 1)
+        m.decorate()
+        return m
 
-        return ColumnMajorMatrix(
+    def _generate_matrix(self) -> RowMajorMatrix:
+        m = self.generate_kind_matrix()
+        return RowMajorMatrix(
             [
                 [
-                    MultiNodeCell(
-                        multi_cell_kind(cell_group),
-                        [cell.node for cell in cell_group],
-                    )
-                    for cell_group in transpose(column_group)
+                    MultiNodeCell(m.kind(r, c), [m.node(r, c)])
+                    for c in range(m.n_columns)
                 ]
-                for column_group in column_groups
+                for r in range(m.n_rows)
             ]
         )
 
-    def render_for_console(self, colorize) -> RowMajorMatrix[str]:
-        return self._render_for_console(self.generate_matrix(), colorize)
-
-    def _render_for_console(self, matrix, colorize) -> RowMajorMatrix[str]:
-        if n_rows(matrix) == 0:
-            return RowMajorMatrix([])
-        n_cols = len(matrix[0])
-        m = RowMajorMatrix(
-            [["." for _ in range(n_cols)] for _ in range(n_rows(matrix))]
+    def render_for_console(
+        self, colorize, viewport: Viewport = Viewport()
+    ) -> RowMajorMatrix[str]:
+        return render_kinds_for_console(
+            self.generate_kind_matrix(), colorize, viewport
         )
 
-        def render_cell(cell: MultiNodeCell):
-            if cell.kind == CellKind.CHANGE:
-                if colorize:
-                    # Make background white
-                    return ANSI_BG_WHITE + " " + ANSI_RESET
-                else:
-                    return "#"
-            if cell.kind == CellKind.BETWEEN_CHANGES:
-                if colorize:
-                    # Make background red
-                    return ANSI_BG_RED + " " + ANSI_RESET
-                else:
-                    return "|"
-            if cell.kind == CellKind.BETWEEN_SQUASHABLE:
-                if colorize:
-                    # Make background yellow
-                    return ANSI_BG_DARK_YELLOW + " " + ANSI_RESET
-                else:
-                    return "^"
-            if cell.kind == CellKind.NO_CHANGE:
-                return "."
-            assert False, "Unexpected cell kind: %s" % (cell.kind)
-
-        for r in range(n_rows(matrix)):
-            for c in range(n_cols):
-                m[r][c] = render_cell(matrix[r][c])
-        return m
-
-
-def n_columns(matrix):
-    if len(matrix) == 0:
-        return 0
-    return len(matrix[0])
-
 
 def n_rows(matrix):
     return len(matrix)
 
 
-def in_range(matrix, r, c):
-    if r < 0 or r >= n_rows(matrix):
-        return False
-    if c < 0 or c >= n_columns(matrix):
-        return False
-    return True
-
-
-def equal_left_column(matrix, r, c):
-    if not in_range(matrix, r, c) or not in_range(matrix, r, c - 1):
-        return False
-    return matrix[r][c - 1].node == matrix[r][c].node
-
-
-def equal_right_column(matrix, r, c):
-    if not in_range(matrix, r, c) or not in_range(matrix, r, c + 1):
-        return False
-    return matrix[r][c + 1].node == matrix[r][c].node
-
-
-def change_at(matrix, r, c):
-    if not in_range(matrix, r, c):
-        return False
-    return matrix[r][c].kind == CellKind.CHANGE
+class ConnectedRow(collections.abc.Sequence):
+    """
+    A row of ConnectedCells that are created when accessed, from the base
+    cells and the bitsets of the neighborhoods of the row.
+    """
 
+    def __init__(self, base: KindMatrix, r: int, bitsets: Status9Neighborhood):
+        self.base = base
+        self.r = r
+        self.bitsets = bitsets
+
+    def __len__(self):
+        return self.base.n_columns
+
+    def __getitem__(self, c):
+        if isinstance(c, slice):
+            return [self[i] for i in range(*c.indices(len(self)))]
+        if c < 0:
+            c += len(self)
+        if not 0 <= c < len(self):
+            raise IndexError(c)
+
+        def status(bitsets):
+            connection, infill = bitsets
+            if connection >> c & 1:
+                return ConnectionStatus.CONNECTION
+            if infill >> c & 1:
+                return ConnectionStatus.INFILL
+            return ConnectionStatus.EMPTY
 
-def no_change_at(matrix, r, c):
-    if not in_range(matrix, r, c):
-        return True
-    return matrix[r][c].kind == CellKind.NO_CHANGE
+        return ConnectedCell(
+            self.base.cell(self.r, c),
+            Status9Neighborhood(*[status(bitsets) for bitsets in self.bitsets]),
+        )
 
 
-class ConnectedFragmap(object):
+class ConnectedFragmap(CachedProducts):
     def __init__(self, fragmap):
         self.fragmap = fragmap
         self.patches = fragmap.patches
 
+    def generate_kind_matrix(self) -> KindMatrix:
+        return self._cached("kind_matrix", self._generate_kind_matrix)
+
+    def _generate_kind_matrix(self) -> KindMatrix:
+        if hasattr(self.fragmap, "generate_kind_matrix"):
+            return self.fragmap.generate_kind_matrix()
+        return KindMatrix.from_cells(self.fragmap.generate_matrix())
+
     def generate_matrix(self) -> RowMajorMatrix:
-        def status(connection=False, infill=False):
-            if connection:
-                return ConnectionStatus.CONNECTION
-            if infill:
-                return ConnectionStatus.INFILL
-            return ConnectionStatus.EMPTY
+        return self._cached("matrix", self._generate_matrix)
+
+    def _generate_matrix(self) -> RowMajorMatrix:
+        """
+        Return the matrix of connected cells. The neighborhoods of all cells
+        on a row are computed at once, as bitsets with bit c for column c,
+        and the cells are only created when they are accessed.
+        """
+        base = self.generate_kind_matrix()
+        changes = base.changes_by_row()
+        # Cells that are not NO_CHANGE
+        nonempty = base.row_bitsets(
+            binary_digit_if(
+                [
+                    CellKind.CHANGE,
+                    CellKind.BETWEEN_CHANGES,
+                    CellKind.BETWEEN_SQUASHABLE,
+                ]
+            )
+        )
+        between = base.row_bitsets(binary_digit_if([CellKind.BETWEEN_CHANGES]))
+        # Cells with the same node as the cell to the left
+        equal_left = []
+        for r in range(base.n_rows):
+            nodes = base.row_nodes(r)
+            equal_left.append(
+                int(
+                    "0"
+                    + "".join(
+                        [
+                            "1" if nodes[c - 1] == nodes[c] else "0"
+                            for c in reversed(range(1, len(nodes)))
+                        ]
+                    )
+                    + "0",
+                    2,
+                )
+            )
 
-        def create_cell(matrix, r, c):
-            base_cell = matrix[r][c]
-            change_center = not no_change_at(matrix, r, c)
-            change_up = not no_change_at(matrix, r - 1, c)
-            change_down = not no_change_at(matrix, r + 1, c)
-            change_left = change_at(matrix, r, c - 1)
-            change_right = change_at(matrix, r, c + 1)
-            equal_left = equal_left_column(matrix, r, c)
-            equal_right = equal_right_column(matrix, r, c)
+        def neighborhood_bitsets(r: int) -> Status9Neighborhood:
+            # The connection and infill bitsets of each position
+            center = nonempty[r]
+            up = nonempty[r - 1] if r > 0 else 0
+            down = nonempty[r + 1] if r + 1 < base.n_rows else 0
+            equal_right = equal_left[r] >> 1
             infill_up_left = (
-                equal_left
-                and not no_change_at(matrix, r, c - 1)
-                and change_up
-                and not no_change_at(matrix, r - 1, c - 1)
-                and change_center
+                equal_left[r] & (center << 1) & up & (up << 1) & center
             )
             infill_up_right = (
-                equal_right
-                and not no_change_at(matrix, r, c + 1)
-                and change_up
-                and not no_change_at(matrix, r - 1, c + 1)
-                and change_center
+                equal_right & (center >> 1) & up & (up >> 1) & center
             )
             infill_down_left = (
-                equal_left
-                and not no_change_at(matrix, r, c - 1)
-                and change_down
-                and not no_change_at(matrix, r + 1, c - 1)
-                and change_center
+                equal_left[r] & (center << 1) & down & (down << 1) & center
             )
             infill_down_right = (
-                equal_right
-                and not no_change_at(matrix, r, c + 1)
-                and change_down
-                and not no_change_at(matrix, r + 1, c + 1)
-                and change_center
+                equal_right & (center >> 1) & down & (down >> 1) & center
             )
-            change_neigh = Status9Neighborhood(
-                up_left=status(infill=infill_up_left),
-                up=status(connection=change_up and change_center),
-                up_right=status(infill=infill_up_right),
-                left=status(
-                    connection=equal_left and change_center and change_left,
-                    infill=infill_up_left,
-                ),
-                center=status(
-                    connection=change_at(matrix, r, c),
-                    infill=matrix[r][c].kind == CellKind.BETWEEN_CHANGES,
+            return Status9Neighborhood(
+                up_left=(0, infill_up_left),
+                up=(up & center, 0),
+                up_right=(0, infill_up_right),
+                left=(
+                    equal_left[r] & center & (changes[r] << 1),
+                    infill_up_left,
                 ),
-                right=status(
-                    connection=equal_right and change_center and change_right,
-                    infill=infill_up_right,
+                center=(changes[r], between[r]),
+                right=(
+                    equal_right & center & (changes[r] >> 1),
+                    infill_up_right,
                 ),
-                down_left=status(infill=infill_down_left),
-                down=status(connection=change_down and change_center),
-                down_right=status(infill=infill_down_right),
+                down_left=(0, infill_down_left),
+                down=(down & center, 0),
+                down_right=(0, infill_down_right),
             )
-            return ConnectedCell(base_cell, change_neigh)
 
-        base_matrix = self.fragmap.generate_matrix()
-        cols = n_columns(base_matrix)
-        rows = n_rows(base_matrix)
         return RowMajorMatrix(
             [
-                [create_cell(base_matrix, r, c) for c in range(cols)]
-                for r in range(rows)
+                ConnectedRow(base, r, neighborhood_bitsets(r))
+                for r in range(base.n_rows)
             ]
         )
 
-    def render_for_console(self, colorize):
+    def render_for_console(self, colorize, viewport: Viewport = Viewport()):
         connection_matrix = self.generate_matrix()
+        rows = viewport.rows(len(connection_matrix))
+        columns = viewport.columns(
+            len(connection_matrix[0]) if connection_matrix else 0
+        )
 
         def create_cell_description(cell) -> List[List[str]]:
             def character(position, status) -> str:
@@ -726,9 +1135,12 @@ class ConnectedFragmap(object):
                 [
                     flatten(v)
                     for v in lzip(
-                        *[create_cell_description(cell) for cell in row]
+                        *[
+                            create_cell_description(connection_matrix[r][c])
+                            for c in columns
+                        ]
                     )
                 ]
-                for row in connection_matrix
+                for r in rows
             ]
         )
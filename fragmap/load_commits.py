@@ -36,22 +36,19 @@
 
 import json
 import os
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 
 import pygit2
 
-from fragmap.datastructure_util import up_to_and_including
-
-from .commitdiff import CommitDiff
+from .commitdiff import CommitDiff, HunkTable, is_nullfile
+from .diff_cache import DiffCache
+from .file_selection import FileSelection
 
 UNSTAGED_HEX = "0000000000000000000000000000000000000000"
 STAGED_HEX = "0000000100000000000000000000000000000000"
 
 
-def is_nullfile(fn):
-    return fn == "/dev/null"
-
-
 def nonnull_file(delta):
     if not is_nullfile(delta.old_file.path):
         return delta.old_file.path
@@ -130,6 +127,107 @@ def get_diff(repo: pygit2.Repository, commit, find_similar=True) -> pygit2.Diff:
     return diff
 
 
+# Repository handle of each worker process of a parallel load
+_worker_repo = None
+
+
+def _init_worker(repo_path):
+    global _worker_repo
+    _worker_repo = pygit2.Repository(repo_path)
+
+
+def _load_ranges_in_worker(commit_hex):
+    commit = hex_to_commit(_worker_repo, commit_hex)
+    # pygit2 diffs cannot be pickled so only the ranges are sent back
+    return HunkTable.from_diff(get_diff(_worker_repo, commit))
+
+
+def _load_ranges_in_parallel(repo: pygit2.Repository, commits, jobs):
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(commits)),
+        initializer=_init_worker,
+        initargs=(repo.path,),
+    ) as executor:
+        return list(
+            executor.map(
+                _load_ranges_in_worker,
+                [str(commit.id) for commit in commits],
+                chunksize=max(1, len(commits) // (4 * jobs)),
+            )
+        )
+
+
+def delta_paths(diff):
+    if isinstance(diff, HunkTable):
+        return diff.delta_paths()
+    return [(delta.old_file.path, delta.new_file.path) for delta in diff.deltas]
+
+
+def selected_patches(diff, keep: List[bool]):
+    if all(keep):
+        return diff
+    if isinstance(diff, HunkTable):
+        return HunkTable.from_diff(
+            [diff.patch(i) for i, kept in enumerate(keep) if kept]
+        )
+    # Only the kept patches are generated by libgit2
+    return [diff[i] for i, kept in enumerate(keep) if kept]
+
+
+def load_diffs(
+    repo: pygit2.Repository,
+    commits,
+    cache: Optional[DiffCache],
+    jobs=1,
+    ranges_only=False,
+    files_arg: Optional[List[str]] = None,
+):
+    """
+    Load the diffs of the commits, in the same order as the commits.
+    With ranges_only, only the file paths and hunk ranges are kept, in a
+    HunkTable per commit, and the pygit2 diff objects are dropped. Diffs from
+    the cache and diffs computed by a pool of worker processes (with more than
+    one job) are always ranges only.
+    With files_arg, the patches of files that will not be shown are dropped
+    before their hunks are generated. Diffs that are filtered this way are not
+    stored in the cache.
+    """
+    keys = [
+        DiffCache.key(commit) if cache is not None else None
+        for commit in commits
+    ]
+    diffs = [cache.lookup(key) if key is not None else None for key in keys]
+    missing = [i for i, diff in enumerate(diffs) if diff is None]
+    if jobs > 1 and len(missing) > 1:
+        computed = _load_ranges_in_parallel(
+            repo, [commits[i] for i in missing], jobs
+        )
+    else:
+        computed = [get_diff(repo, commits[i]) for i in missing]
+    file_selection = FileSelection.from_files_arg(files_arg)
+    for i, diff in zip(missing, computed):
+        if isinstance(diff, HunkTable):
+            if keys[i] is not None:
+                cache.store(keys[i], diff)
+        elif keys[i] is not None and file_selection.patterns.patterns is None:
+            diff = HunkTable.from_diff(diff)
+            cache.store(keys[i], diff)
+        diffs[i] = diff
+    if file_selection.patterns.patterns is not None:
+        keeps = file_selection.select_patches(
+            [delta_paths(diff) for diff in diffs]
+        )
+        diffs = [
+            selected_patches(diff, keep) for diff, keep in zip(diffs, keeps)
+        ]
+    if ranges_only:
+        diffs = [
+            diff if isinstance(diff, HunkTable) else HunkTable.from_diff(diff)
+            for diff in diffs
+        ]
+    return diffs
+
+
 def hex_to_commit(repo, hex):
     if hex == STAGED_HEX:
         return Staged()
@@ -188,6 +286,40 @@ class CommitSelectionError(RuntimeError):
     pass
 
 
+def first_parent_ancestry(
+    repo: pygit2.Repository,
+    end_commit: pygit2.Commit,
+    boundary_id: Optional[pygit2.Oid],
+    max_count: Optional[int],
+) -> List[pygit2.Commit]:
+    """
+    Follow the first parents back from end_commit, newest first, and stop
+    before the boundary commit (or any ancestor of it), before the root commit
+    or after max_count commits. Only the selected commits are visited,
+    unlike a topologically sorted walk of the whole history.
+    """
+    commits = []
+    commit = end_commit
+    passed_merge = False
+    while (
+        commit.parents
+        and commit.id != boundary_id
+        and (max_count is None or len(commits) < max_count)
+    ):
+        # The boundary may have been merged in, so that the first parents of
+        # the merge only reach ancestors of the boundary
+        if (
+            passed_merge
+            and boundary_id is not None
+            and repo.descendant_of(boundary_id, commit.id)
+        ):
+            break
+        commits.append(commit)
+        passed_merge = passed_merge or len(commit.parent_ids) > 1
+        commit = commit.parents[0]
+    return commits
+
+
 class CommitSelection(object):
     def __init__(
         self, since_ref, until_ref, max_count, include_staged, include_unstaged
@@ -200,30 +332,34 @@ class CommitSelection(object):
 
     def get_items(self, repo) -> List[pygit2.Commit]:
         print("... Finding commits            \r", end="")
-        walker = repo.walk(
-            repo.head.target,
-            pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE,
-        )
         if self.end:
-            walker.push(repo.revparse_single(self.end).id)
+            end_commit = repo.revparse_single(self.end).peel(pygit2.Commit)
+        else:
+            end_commit = repo.head.peel(pygit2.Commit)
+        boundary_id = None
         if self.start:
-            walker.hide(repo.revparse_single(self.start).id)
-        if not (self.start or self.end):
-            walker.hide(repo.revparse_single("HEAD~" + str(self.max_count)).id)
-        walker.simplify_first_parent()
-        # Collect all selected commits
-        commits = [commit for commit in walker]
-        if self.end:
-            end_commit = repo.revparse_single(self.end)
-            cut_commits = up_to_and_including(
-                commits, lambda c: c == end_commit
-            )
-            if end_commit.id not in [c.id for c in cut_commits]:
+            start_commit = repo.revparse_single(self.start).peel(pygit2.Commit)
+            boundary_id = repo.merge_base(start_commit.id, end_commit.id)
+            # The selection is empty if they are the same commit
+            if (
+                boundary_id == end_commit.id
+                and start_commit.id != end_commit.id
+            ):
                 raise CommitSelectionError(
                     f"Error: 'until' commit {end_commit.id} is not a descendant from "
                     f"the selected start commit so the selection does not make sense."
                 )
-            commits = cut_commits
+        # Collect all selected commits, oldest first
+        commits = list(
+            reversed(
+                first_parent_ancestry(
+                    repo,
+                    end_commit,
+                    boundary_id,
+                    None if self.start else self.max_count,
+                )
+            )
+        )
 
         if self.max_count:
             # Limit the number of commits
@@ -259,7 +395,14 @@ class ExplicitCommitSelection(object):
 
 class CommitLoader(object):
     @staticmethod
-    def load(repo_dir, commit_selection) -> List[CommitDiff]:
+    def load(
+        repo_dir,
+        commit_selection,
+        use_cache=False,
+        jobs=1,
+        ranges_only=False,
+        files_arg=None,
+    ) -> List[CommitDiff]:
         repo_root = pygit2.discover_repository(repo_dir)
         if repo_root is None:
             raise RuntimeError(
@@ -268,9 +411,16 @@ class CommitLoader(object):
         repo = pygit2.Repository(repo_root)
         commits = commit_selection.get_items(repo)
         print("... Retrieving fragments       \r", end="")
+        cache = DiffCache.for_repository(repo) if use_cache else None
         commitdiffs = [
-            CommitDiff(commit, get_diff(repo, commit)) for commit in commits
+            CommitDiff(commit, diff)
+            for commit, diff in zip(
+                commits,
+                load_diffs(repo, commits, cache, jobs, ranges_only, files_arg),
+            )
         ]
+        if cache is not None:
+            cache.evict()
         print("                               \r", end="")
         return commitdiffs
 
@@ -17,18 +17,30 @@ import argparse
 import os
 import sys
 
-from fragmap.console_color import ANSI_UP
-from fragmap.console_ui import print_fragmap
-from fragmap.generate_matrix import BriefFragmap, ConnectedFragmap, Fragmap
+from fragmap.console_ui import (
+    Repainter,
+    ViewportError,
+    print_fragmap,
+    render_fragmap_lines,
+)
+from fragmap.generate_matrix import (
+    BriefFragmap,
+    ConnectedFragmap,
+    Fragmap,
+    Viewport,
+)
 from fragmap.load_commits import CommitLoader, CommitSelection
+from fragmap.update import SPGBuilder
 from fragmap.web_ui import open_fragmap_page, start_fragmap_server
 from getch.getch import getch
 
 from . import debug
 
 
-def make_fragmap(diff_list, files_arg, brief=False, infill=False) -> Fragmap:
-    fragmap = Fragmap.from_diffs(diff_list, files_arg)
+def make_fragmap(
+    diff_list, files_arg, brief=False, infill=False, builder=None
+) -> Fragmap:
+    fragmap = Fragmap.from_diffs(diff_list, files_arg, builder)
     # with open('fragmap_ast.json', 'wb') as f:
     #   json.dump(fragmap.patches, f, cls=DictCoersionEncoder)
     if brief:
@@ -98,6 +110,22 @@ def main():
         required=False,
         help="Disable checking that the repository is owned by the current user.",
     )
+    argparser.add_argument(
+        "--no-cache",
+        action="store_true",
+        required=False,
+        help="Do not use the on-disk cache of previously computed commit diffs.",
+    )
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="JOBS",
+        type=int,
+        default=1,
+        action="store",
+        required=False,
+        help="How many processes to compute commit diffs and file graphs with. The default is 1.",
+    )
     argparser.add_argument(
         "-l",
         "--live",
@@ -113,6 +141,23 @@ def main():
         required=False,
         help="Show the full fragmap, disabling deduplication of the columns.",
     )
+    argparser.add_argument(
+        "--columns-offset",
+        metavar="COLUMNS",
+        type=int,
+        default=0,
+        action="store",
+        required=False,
+        help="How many columns of the fragmap to skip from the left, to page through fragmaps that are wider than the terminal. The default is 0.",
+    )
+    argparser.add_argument(
+        "--max-columns",
+        metavar="COLUMNS",
+        type=int,
+        action="store",
+        required=False,
+        help="How many columns of the fragmap to show at most. Only the shown columns are rendered. The default is all columns.",
+    )
     outformatarg.add_argument(
         "-w",
         "--web",
@@ -120,6 +165,13 @@ def main():
         required=False,
         help="Generate and open an HTML document instead of printing to console. Implies -f",
     )
+    outformatarg.add_argument(
+        "-t",
+        "--tui",
+        action="store_true",
+        required=False,
+        help="Show the fragmap in an interactive full screen viewer that scrolls through the rows and columns, jumps between files with [ and ] and shows the hunk under the cursor. Press r to refresh and q to quit.",
+    )
     argparser.add_argument(
         "-i",
         "--files",
@@ -128,7 +180,11 @@ def main():
         action="store",
         required=False,
         dest="files",
-        help="Which files to show changes " "from. The default is all files.",
+        help="Which files to show changes "
+        "from. The default is all files. Directories select the files in them. "
+        "The glob characters *, ? and [ can be used, and ** matches any number "
+        "of directories. Paths of existing files are matched literally, and "
+        "[*], [?] and [[] match the characters literally in other paths.",
     )
 
     args = argparser.parse_args()
@@ -145,8 +201,9 @@ def main():
         max_count = int(args.n)
     if not (args.until or args.since or args.n):
         max_count = 3
-    lines_printed = [0]
     columns_printed = [0]
+    # Keeps the SPGs of unchanged commits between refreshes in live mode
+    builder = SPGBuilder(jobs=args.jobs)
 
     def serve():
         def erase_current_line():
@@ -163,40 +220,78 @@ def main():
         )
         is_full = args.full or args.web
         debug.get("console").debug(selection)
-        diff_list = cl.load(os.getcwd(), selection)
+        # Only the hunk ranges are needed unless the web page shows the lines
+        ranges_only = not args.web
+        use_cache = ranges_only and not args.no_cache
+        jobs = args.jobs if ranges_only else 1
+        diff_list = cl.load(
+            os.getcwd(),
+            selection,
+            use_cache=use_cache,
+            jobs=jobs,
+            ranges_only=ranges_only,
+            files_arg=args.files,
+        )
         debug.get("console").debug(diff_list)
         print("... Generating fragmap\r", end="")
-        fm = make_fragmap(diff_list, args.files, not is_full, False)
+        fm = make_fragmap(diff_list, args.files, not is_full, False, builder)
         print("                      \r", end="")
-        # Erase each line and move cursor up to overwrite previous fragmap
         erase_current_line()
-        for _ in range(lines_printed[0]):
-            print(ANSI_UP, end="")
-            erase_current_line()
         return fm
 
+    def show_in_console(fragmap):
+        if not args.live:
+            print_fragmap(
+                fragmap, do_color=not args.no_color, viewport=viewport
+            )
+            return
+        # Overwrites only the lines of the previous fragmap that changed. The
+        # prompt is the last line, so that it is erased too when the fragmap
+        # gets shorter or live mode ends.
+        repainter = Repainter()
+        while True:
+            lines, columns_printed[0] = render_fragmap_lines(
+                fragmap, do_color=not args.no_color, viewport=viewport
+            )
+            sys.stdout.write(
+                repainter.repaint(lines + ["Press Enter to refresh"])
+            )
+            sys.stdout.flush()
+            key = getch()
+            if ord(key) != 0xD:
+                break
+            fragmap = serve()
+        # Erase the prompt and leave the cursor at the start of the line
+        # below the fragmap, for the shell prompt
+        sys.stdout.write(repainter.repaint(lines))
+        sys.stdout.flush()
+
+    viewport = Viewport(
+        column_offset=args.columns_offset, max_columns=args.max_columns
+    )
     fragmap = serve()
     if args.web:
         if args.live:
             start_fragmap_server(serve)
         else:
             open_fragmap_page(fragmap, args.live)
+    elif args.tui:
+        try:
+            from fragmap import tui
+        except ImportError:
+            print("Error: --tui/-t needs the curses module")
+            exit(1)
+        try:
+            tui.run(fragmap, serve, not args.no_color, viewport)
+        except ViewportError as e:
+            print(e)
+            exit(1)
     else:
-        lines_printed[0], columns_printed[0] = print_fragmap(
-            fragmap, do_color=not args.no_color
-        )
-        if args.live:
-            while True:
-                print("Press Enter to refresh", end="")
-                sys.stdout.flush()
-                key = getch()
-                if ord(key) != 0xD:
-                    break
-                fragmap = serve()
-                lines_printed[0], columns_printed[0] = print_fragmap(
-                    fragmap, do_color=not args.no_color
-                )
-            print("")
+        try:
+            show_in_console(fragmap)
+        except ViewportError as e:
+            print(e)
+            exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fragmap.spg import FileId
+
+
+@dataclass
+class RenameGeneration:
+    """
+    What one generation changed in a RenameIndex, to be able to undo it.
+    """
+
+    # The original file of each file patch
+    originals: List[FileId]
+    # The original file that each path had before, or None, for the paths that
+    # got another original file
+    replaced: Dict[str, Optional[FileId]]
+    # The paths that were new to the history of their original file
+    added_paths: List[Tuple[FileId, str]]
+
+
+@dataclass
+class RenameIndex:
+    """
+    Follows files through the renames of a series of diffs. Each file is
+    identified by its original file: the path and generation before the first
+    diff that changed it. Only the paths in a diff are updated for each
+    generation, so files that are not changed cost nothing. The original file
+    of a path is only known after the latest generation, since the graphs are
+    built one generation at a time. Earlier generations are only needed to
+    rebuild from them, and truncate() restores them for that.
+    """
+
+    generations: int = 0
+    # The original file of each path after the latest generation
+    _current: Dict[str, FileId] = field(default_factory=lambda: {})
+    # The paths of each original file after the latest generation
+    _current_paths: Dict[FileId, Dict[str, None]] = field(
+        default_factory=lambda: {}
+    )
+    # All paths that each original file has had, in the order they were seen
+    _paths: Dict[FileId, Dict[str, None]] = field(default_factory=lambda: {})
+    _log: List[RenameGeneration] = field(default_factory=lambda: [])
+
+    def update(
+        self, delta_paths: List[Tuple[str, str]]
+    ) -> Tuple[List[FileId], List[FileId]]:
+        """
+        Add a generation with file patches of the given old and new paths.
+        Return the original files that the previous generation changed but
+        this one does not, once for each of their unchanged paths, and the
+        original file of each file patch. Files that were not changed by the
+        previous generation either are left out since their graphs do not
+        need to be updated, see update_unchanged_spg().
+        """
+        generation = self.generations
+        changed_old_paths = set([old_path for old_path, _ in delta_paths])
+        unchanged = [
+            original
+            for original in dict.fromkeys(
+                self._log[-1].originals if self._log else []
+            )
+            for path in self._current_paths.get(original, {})
+            if path not in changed_old_paths
+        ]
+
+        record = RenameGeneration([], {}, [])
+        # Files that have not been seen before are their own original files
+        old_originals = [
+            self._current.get(old_path, FileId(generation - 1, old_path))
+            for old_path, _ in delta_paths
+        ]
+        for (old_path, new_path), original in zip(delta_paths, old_originals):
+            self._add_path(original, old_path, record)
+            self._add_path(original, new_path, record)
+        for old_path in changed_old_paths:
+            self._assign(old_path, None, record)
+        for (_, new_path), original in zip(delta_paths, old_originals):
+            self._assign(new_path, original, record)
+        record.originals = [
+            self._current[new_path] for _, new_path in delta_paths
+        ]
+
+        for path, replaced in list(record.replaced.items()):
+            if self._current.get(path) == replaced:
+                del record.replaced[path]
+        self._log.append(record)
+        self.generations += 1
+        return unchanged, record.originals
+
+    def truncate(self, generation: int):
+        """
+        Undo the generations from the given one and on.
+        """
+        while self.generations > generation:
+            record = self._log.pop()
+            self.generations -= 1
+            for path, replaced in record.replaced.items():
+                self._assign(path, replaced)
+            for original, path in reversed(record.added_paths):
+                del self._paths[original][path]
+                if not self._paths[original]:
+                    del self._paths[original]
+
+    def _assign(
+        self,
+        path: str,
+        original: Optional[FileId],
+        record: Optional[RenameGeneration] = None,
+    ):
+        previous = self._current.pop(path, None)
+        if record is not None and path not in record.replaced:
+            record.replaced[path] = previous
+        if previous is not None:
+            del self._current_paths[previous][path]
+            if not self._current_paths[previous]:
+                del self._current_paths[previous]
+        if original is not None:
+            self._current[path] = original
+            self._current_paths.setdefault(original, {})[path] = None
+
+    def _add_path(self, original: FileId, path: str, record: RenameGeneration):
+        paths = self._paths.setdefault(original, {})
+        if path not in paths:
+            paths[path] = None
+            record.added_paths.append((original, path))
+
+    def originals(self) -> Iterable[FileId]:
+        return self._paths.keys()
+
+    def paths(self, original: FileId) -> Iterable[str]:
+        """
+        Return all paths that the file has had.
+        """
+        return self._paths.get(original, {}).keys()
@@ -18,38 +18,19 @@
 from __future__ import annotations
 
 import dataclasses
+from array import array
 from dataclasses import dataclass
 from math import inf
 from pprint import pformat
-from typing import Dict, List, Union
+from typing import Callable, Dict, List, TypeVar, Union
 
 import pygit2
 
+from fragmap.commitdiff import DiffHunk, is_nullfile
 from fragmap.list_dict import StableListDict
-from fragmap.load_commits import is_nullfile
 from fragmap.span import Span
 
 
-@dataclass(frozen=True)
-class DiffHunk:
-    old_start: int
-    old_lines: int
-    new_start: int
-    new_lines: int
-    lines: str = dataclasses.field(default_factory=tuple)
-
-    @staticmethod
-    def from_tup(old_start_and_lines, new_start_and_lines):
-        old_start, old_lines = old_start_and_lines
-        new_start, new_lines = new_start_and_lines
-        return DiffHunk(
-            old_start=old_start,
-            old_lines=old_lines,
-            new_start=new_start,
-            new_lines=new_lines,
-        )
-
-
 @dataclass(frozen=True)
 class Node:
     hunk: Union[pygit2.DiffHunk, DiffHunk]
@@ -111,28 +92,42 @@ SINK = Node.inactive((0, inf), (0, 0), inf)
 
 @dataclass
 class SPG:
-    graph: Dict[Node, List[Node]]
+    # The ends of the edges from each node, as insertion ordered dicts used as
+    # sets
+    graph: Dict[Node, Dict[Node, None]]
     downstream_from_active: Dict[Node, bool] = dataclasses.field(
         default_factory=lambda: {}
     )
+    # Generations where the file is unchanged are only added to the graph
+    # right after a generation with active nodes, see update()
+    last_active_generation: int = -1
+    # The nodes with an edge to the sink, which the next generation is added
+    # on top of
+    frontier: Dict[Node, None] = dataclasses.field(default_factory=lambda: {})
 
     @staticmethod
     def empty() -> SPG:
         return SPG(
             {
-                SOURCE: [SINK],
+                SOURCE: {SINK: None},
             },
             downstream_from_active={SOURCE: False},
+            frontier={SOURCE: None},
         )
 
     def register(self, prev_node, node):
-        if prev_node not in self.graph.keys():
-            self.graph[prev_node] = []
-        self.graph[prev_node] = [
-            item for item in self.graph[prev_node] if item != SINK
-        ]
-        self.graph[prev_node].append(node)
+        ends = self.graph.setdefault(prev_node, {})
+        ends.pop(SINK, None)
+        ends[node] = None
+        if node == SINK:
+            self.frontier[prev_node] = None
+        else:
+            self.frontier.pop(prev_node, None)
         self.propagate_active(prev_node, node)
+        if node.is_active:
+            self.last_active_generation = max(
+                self.last_active_generation, node.generation
+            )
 
     def propagate_active(self, prev_node, node):
         if not prev_node in self.downstream_from_active:
@@ -143,6 +138,36 @@ class SPG:
             prev_node
         ]
 
+    def truncate(self, generation: int):
+        """
+        Remove all nodes from the given generation and later, restoring the
+        graph to how it was before that generation was added.
+        """
+        removed = set(
+            [
+                node
+                for node in self.graph.keys()
+                if node.generation >= generation and node != SINK
+            ]
+        )
+        if not removed:
+            return
+        for node in removed:
+            del self.graph[node]
+            self.downstream_from_active.pop(node, None)
+        for prev_node, ends in self.graph.items():
+            for end in [end for end in ends if end in removed]:
+                del ends[end]
+            if not ends:
+                ends[SINK] = None
+        self.frontier = {
+            node: None for node, ends in self.graph.items() if SINK in ends
+        }
+        self.last_active_generation = max(
+            [node.generation for node in self.graph.keys() if node.is_active],
+            default=-1,
+        )
+
     def nodes(self):
         return self.graph.keys()
 
@@ -210,3 +235,216 @@ class SPG:
             ]
         )
         return f"SPG({attributes})\n{self.to_dot(FileId(0, 'unknown'))}"
+
+
+Cached = TypeVar("Cached")
+
+
+def _row(value: float):
+    # Rows are stored as floats to be able to represent infinity
+    return value if value == inf else int(value)
+
+
+@dataclass
+class CompactSPG:
+    """
+    A read-only copy of an SPG where the nodes are integer ids indexing
+    parallel arrays, and the edges are in compressed sparse row form: the ends
+    of the edges from node i are ends[offsets[i]:offsets[i + 1]], sorted by
+    their new and old spans. The hunks of active nodes are kept as they are
+    since they can carry the changed lines. Other nodes are recreated from the
+    arrays when needed.
+    """
+
+    generation: array
+    old_start: array
+    old_end: array
+    new_start: array
+    new_end: array
+    is_active: array
+    is_downstream_from_active: array
+    # Whether there is an active node at or after each node
+    reaches_active: array
+    offsets: array
+    ends: array
+    active_hunks: Dict[int, Union[pygit2.DiffHunk, DiffHunk]]
+    source: int
+    sink: int
+    _cache: Dict[str, object] = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    @staticmethod
+    def from_spg(spg: SPG) -> CompactSPG:
+        nodes = list(spg.graph.keys()) + [SINK]
+        ids = {node: i for i, node in enumerate(nodes)}
+        old_spans = [Span.from_old(node.hunk) for node in nodes]
+        new_spans = [Span.from_new(node.hunk) for node in nodes]
+        offsets = array("i", [0])
+        ends = array("i")
+        for node in nodes[:-1]:
+            ends.extend(
+                sorted(
+                    [ids[end] for end in spg.graph[node]],
+                    key=lambda i: (
+                        new_spans[i].start,
+                        old_spans[i].start,
+                        new_spans[i].end,
+                        old_spans[i].end,
+                    ),
+                )
+            )
+            offsets.append(len(ends))
+        offsets.append(len(ends))
+        reaches_active = array("b", [node.is_active for node in nodes])
+        # The edges always go to later generations
+        for i in sorted(
+            range(len(nodes)), key=lambda i: nodes[i].generation, reverse=True
+        ):
+            for end in ends[offsets[i] : offsets[i + 1]]:
+                reaches_active[i] |= reaches_active[end]
+        return CompactSPG(
+            generation=array("d", [node.generation for node in nodes]),
+            old_start=array("d", [span.start for span in old_spans]),
+            old_end=array("d", [span.end for span in old_spans]),
+            new_start=array("d", [span.start for span in new_spans]),
+            new_end=array("d", [span.end for span in new_spans]),
+            is_active=array("b", [node.is_active for node in nodes]),
+            is_downstream_from_active=array(
+                "b",
+                [
+                    spg.downstream_from_active.get(node, node.is_active)
+                    for node in nodes
+                ],
+            ),
+            reaches_active=reaches_active,
+            offsets=offsets,
+            ends=ends,
+            active_hunks={
+                i: node.hunk for i, node in enumerate(nodes) if node.is_active
+            },
+            source=ids[SOURCE],
+            sink=ids[SINK],
+        )
+
+    def __len__(self):
+        return len(self.generation)
+
+    def successors(self, i: int) -> array:
+        return self.ends[self.offsets[i] : self.offsets[i + 1]]
+
+    def node(self, i: int) -> Node:
+        if self.is_active[i]:
+            return Node(
+                self.active_hunks[i], _row(self.generation[i]), is_active=True
+            )
+        return Node.inactive(
+            Span(_row(self.old_start[i]), _row(self.old_end[i])).to_git(),
+            Span(_row(self.new_start[i]), _row(self.new_end[i])).to_git(),
+            _row(self.generation[i]),
+        )
+
+    def _cached(self, name: str, generate: Callable[[], Cached]) -> Cached:
+        # The mappings from nodes recreate every node so they are only
+        # generated once, when first used
+        if name not in self._cache:
+            self._cache[name] = generate()
+        return self._cache[name]
+
+    def node_id(self, node: Node) -> int:
+        return self._cached(
+            "node_ids", lambda: {self.node(i): i for i in range(len(self))}
+        )[node]
+
+    def commits(self) -> Dict[int, CommitNodes]:
+        ids_by_generation: Dict[int, List[int]] = {}
+        for i in range(len(self)):
+            if i != self.sink:
+                ids_by_generation.setdefault(
+                    _row(self.generation[i]), []
+                ).append(i)
+        return {
+            generation: CommitNodes([self.node(i) for i in ids])
+            for generation, ids in sorted(ids_by_generation.items())
+        }
+
+    def to_dot(self, file_id: FileId):
+        def name(i):
+            if i == self.source:
+                return "s"
+            if i == self.sink:
+                return "t"
+
+            prefix = ""
+            if self.is_active[i]:
+                prefix += "A"
+            if self.is_downstream_from_active[i]:
+                prefix += "d"
+            if prefix:
+                prefix = f"_{prefix}_"
+            return (
+                f"{prefix}n{_row(self.generation[i])}_"
+                f"{_row(self.old_start[i])}_{_row(self.old_end[i])}_"
+                f"{_row(self.new_start[i])}_{_row(self.new_end[i])}"
+            )
+
+        return (
+            f"""
+    # {file_id}
+    digraph G {{
+    """
+            + "\n".join(
+                [
+                    f"{name(i)} -> {name(end)};"
+                    for i in range(len(self))
+                    for end in self.successors(i)
+                ]
+            )
+            + """
+      s [shape=Mdiamond];
+      t [shape=Msquare];
+    }
+  """
+        )
+
+    def pformat(self):
+        attributes = "\n".join(
+            [
+                f"{field.name}:\n{pformat(getattr(self, field.name), indent=3)}"
+                for field in dataclasses.fields(self)
+                if field.repr
+            ]
+        )
+        dot = self.to_dot(FileId(0, "unknown"))
+        return f"CompactSPG({attributes})\n{dot}"
+
+    # Adapters to the interface of SPG
+
+    @property
+    def graph(self) -> Dict[Node, Dict[Node, None]]:
+        return self._cached(
+            "graph",
+            lambda: {
+                self.node(i): {
+                    self.node(end): None for end in self.successors(i)
+                }
+                for i in range(len(self))
+                if i != self.sink
+            },
+        )
+
+    @property
+    def downstream_from_active(self) -> Dict[Node, bool]:
+        return self._cached(
+            "downstream_from_active",
+            lambda: {
+                self.node(i): bool(self.is_downstream_from_active[i])
+                for i in range(len(self))
+            },
+        )
+
+    def nodes(self):
+        return self.graph.keys()
+
+    def items(self):
+        return self.graph.items()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import curses
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from fragmap.common_ui import first_line
+from fragmap.console_ui import check_column_offset
+from fragmap.generate_matrix import CellKind, LazyKindMatrix, Viewport
+from fragmap.spg import FileId
+
+HASH_WIDTH = 8
+HELP = "hjkl: move, PgUp/PgDn: page, [/]: file, r: refresh, q: quit"
+
+
+@dataclass
+class FragmapView:
+    """
+    The cursor of the interactive viewer and the region of the fragmap around
+    it that is scrolled into view. The columns are the merged columns of the
+    console output, see LazyKindMatrix. The cells are only generated for the
+    blocks of columns that have been scrolled into view. The fragmap must
+    render one character per cell, so it can not be a ConnectedFragmap.
+    """
+
+    fragmap: object
+    # The number of rows and columns of cells that fit on the screen
+    height: int
+    width: int
+    max_columns: Optional[int] = None
+    cursor_row: int = 0
+    cursor_column: int = 0
+    top: int = 0
+    left: int = 0
+    _kind_matrix: LazyKindMatrix = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.show(self.fragmap)
+
+    def show(self, fragmap):
+        """
+        Show the fragmap instead, with the cursor at the same cell if it is
+        still there.
+        """
+        self.fragmap = fragmap
+        self._kind_matrix = fragmap.generate_lazy_kind_matrix()
+        self.move(0, 0)
+
+    def n_rows(self) -> int:
+        return self._kind_matrix.n_rows
+
+    def n_columns(self) -> int:
+        return self._kind_matrix.n_columns
+
+    def resize(self, height: int, width: int):
+        if self.max_columns is not None:
+            width = min(width, self.max_columns)
+        self.height = max(1, height)
+        self.width = max(1, width)
+        self.move(0, 0)
+
+    def move(self, rows: int, columns: int):
+        self.move_to(self.cursor_row + rows, self.cursor_column + columns)
+
+    def move_to(self, row: int, column: int):
+        """
+        Move the cursor to the cell, or the closest one in the fragmap, and
+        scroll just enough to show it.
+        """
+        self.cursor_row = max(0, min(row, self.n_rows() - 1))
+        self.cursor_column = max(0, min(column, self.n_columns() - 1))
+        self.top = min(self.top, self.cursor_row)
+        self.top = max(self.top, self.cursor_row - self.height + 1)
+        self.left = min(self.left, self.cursor_column)
+        self.left = max(self.left, self.cursor_column - self.width + 1)
+
+    def _file_id(self, c: int) -> FileId:
+        return self._kind_matrix.file_id(c)
+
+    def _file_start(self, c: int) -> int:
+        # The columns of each file are next to each other
+        while c > 0 and self._file_id(c - 1) == self._file_id(c):
+            c -= 1
+        return c
+
+    def next_file(self):
+        if not self.n_rows():
+            return
+        c = self.cursor_column
+        while c < self.n_columns() and self._file_id(c) == self._file_id(
+            self.cursor_column
+        ):
+            c += 1
+        if c < self.n_columns():
+            self.move_to(self.cursor_row, c)
+
+    def previous_file(self):
+        if not self.n_rows():
+            return
+        start = self._file_start(self.cursor_column)
+        if start > 0:
+            self.move_to(self.cursor_row, self._file_start(start - 1))
+
+    def viewport(self) -> Viewport:
+        return Viewport(self.top, self.left, self.height, self.width)
+
+    def visible_rows(self) -> List[str]:
+        return [
+            "".join(row)
+            for row in self._kind_matrix.render_for_console(
+                False, self.viewport()
+            )
+        ]
+
+    def status(self) -> str:
+        """
+        Describe the commit and the hunk of the cell under the cursor.
+        """
+        if not self.n_rows() or not self.n_columns():
+            return ""
+        r = self.cursor_row
+        cell = self._kind_matrix.cell(r, self.cursor_column)
+        header = self.fragmap.patches()[r].header
+        description = "%s %s" % (
+            str(header.id)[0:HASH_WIDTH],
+            cell.file_id.path,
+        )
+        if cell.kind == CellKind.CHANGE:
+            hunk = cell.node.hunk
+            description += " @@ -%d,%d +%d,%d @@" % (
+                hunk.old_start,
+                hunk.old_lines,
+                hunk.new_start,
+                hunk.new_lines,
+            )
+        return description
+
+
+def _draw(screen, view: FragmapView, attributes):
+    screen.erase()
+    screen_height, screen_width = screen.getmaxyx()
+    patches = view.fragmap.patches()
+    commit_width = max(
+        0,
+        min(
+            max([len(first_line(p.header.message)) for p in patches] + [0]),
+            screen_width // 3,
+        ),
+    )
+    text_width = HASH_WIDTH + 1 + commit_width + 1
+    if screen_height < 2 or screen_width < text_width + 2:
+        screen.addnstr(0, 0, "The terminal is too small", screen_width - 1)
+        screen.refresh()
+        return
+    # The last line is the status line
+    view.resize(screen_height - 1, screen_width - text_width - 1)
+    for i, row in enumerate(view.visible_rows()):
+        r = view.top + i
+        header = patches[r].header
+        screen.addstr(i, 0, str(header.id)[0:HASH_WIDTH], attributes["hash"])
+        screen.addnstr(
+            i, HASH_WIDTH + 1, first_line(header.message), commit_width
+        )
+        for j, character in enumerate(row):
+            attribute = attributes.get(character, curses.A_NORMAL)
+            if (r, view.left + j) == (view.cursor_row, view.cursor_column):
+                attribute |= curses.A_REVERSE
+            screen.addstr(i, text_width + j, character, attribute)
+    status = view.status() or HELP
+    screen.addnstr(screen_height - 1, 0, status, screen_width - 1)
+    screen.refresh()
+
+
+def _attributes(colorize: bool):
+    attributes = {"hash": curses.A_NORMAL}
+    if not colorize or not curses.has_colors():
+        return attributes
+    curses.use_default_colors()
+    for pair, (character, foreground, background) in enumerate(
+        [
+            ("#", curses.COLOR_BLACK, curses.COLOR_WHITE),
+            ("|", curses.COLOR_BLACK, curses.COLOR_RED),
+            ("^", curses.COLOR_BLACK, curses.COLOR_YELLOW),
+            ("hash", curses.COLOR_CYAN, -1),
+        ],
+        start=1,
+    ):
+        curses.init_pair(pair, foreground, background)
+        attributes[character] = curses.color_pair(pair)
+    return attributes
+
+
+def run(
+    fragmap,
+    refresh: Callable[[], object],
+    colorize: bool = True,
+    viewport: Viewport = Viewport(),
+):
+    """
+    Show the fragmap in a full screen viewer until the user quits. The
+    refresh function is called to get an updated fragmap when the user asks
+    for it. The viewer starts at the column offset of the viewport and shows
+    at most its number of columns.
+    """
+    view = FragmapView(
+        fragmap, height=1, width=1, max_columns=viewport.max_columns
+    )
+    check_column_offset(viewport, view.n_columns())
+    view.left = viewport.column_offset
+    view.move_to(0, viewport.column_offset)
+
+    def loop(screen):
+        curses.curs_set(0)
+        attributes = _attributes(colorize)
+        while True:
+            _draw(screen, view, attributes)
+            key = screen.getch()
+            if key in [ord("q"), 27]:
+                return
+            elif key in [curses.KEY_UP, ord("k")]:
+                view.move(-1, 0)
+            elif key in [curses.KEY_DOWN, ord("j")]:
+                view.move(1, 0)
+            elif key in [curses.KEY_LEFT, ord("h")]:
+                view.move(0, -1)
+            elif key in [curses.KEY_RIGHT, ord("l")]:
+                view.move(0, 1)
+            elif key == curses.KEY_PPAGE:
+                view.move(0, -view.width)
+            elif key == curses.KEY_NPAGE:
+                view.move(0, view.width)
+            elif key == curses.KEY_HOME:
+                view.move_to(view.cursor_row, 0)
+            elif key == curses.KEY_END:
+                view.move_to(view.cursor_row, view.n_columns())
+            elif key == ord("["):
+                view.previous_file()
+            elif key == ord("]"):
+                view.next_file()
+            elif key == ord("r"):
+                # Leave the screen to the status messages while refreshing
+                curses.endwin()
+                view.show(refresh())
+
+    curses.wrapper(loop)
@@ -17,52 +17,32 @@
 # To be able to use the enclosing class type in class method type hints
 from __future__ import annotations
 
-from bisect import bisect_right
+import heapq
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pprint import pformat
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import pygit2
 
-from fragmap.commitdiff import CommitDiff
+from fragmap.commitdiff import (
+    CommitDiff,
+    DiffDelta,
+    DiffFile,
+    DiffHunk,
+    DiffLine,
+    HunkTable,
+    Patch,
+)
 from fragmap.datastructure_util import flatten
+from fragmap.renames import RenameIndex
 from fragmap.span import Overlap, Span
-from fragmap.spg import SINK, SPG, CommitNodes, DiffHunk, FileId, Node
+from fragmap.spg import SINK, SPG, CommitNodes, FileId, Node
 
 from . import debug
 
 
-@dataclass(frozen=True)
-class DiffFile:
-    path: str
-
-
-@dataclass(frozen=True)
-class DiffDelta:
-    old_file: DiffFile
-    new_file: DiffFile
-    is_binary: bool
-
-    @staticmethod
-    def from_paths(old_file_path, new_file_path):
-        return DiffDelta(
-            old_file=DiffFile(old_file_path),
-            new_file=DiffFile(new_file_path),
-            is_binary=False,
-        )
-
-
-@dataclass(frozen=True)
-class DiffLine:
-    content: str
-
-
-@dataclass(frozen=True)
-class Patch:
-    delta: DiffDelta
-    hunks: list[DiffHunk]
-
-
 class Diff(list):
     pass
 
@@ -200,6 +180,45 @@ def add_on_top_of(spg: SPG, nodes_from_previous_commit: List[Node], node: Node):
     assert some_overlap
 
 
+@dataclass
+class OverlapIndex:
+    """
+    Finds the nodes whose new span overlaps a given span in any way, among
+    nodes sorted by node_by_new.
+    """
+
+    nodes: List[Node]
+    _starts: List[int]
+    # The largest end of the new spans of all nodes up to each index
+    _max_ends: List[int]
+
+    @staticmethod
+    def from_nodes_by_new(nodes: List[Node]):
+        spans = [Span.from_new(node.hunk) for node in nodes]
+        max_ends = []
+        for span in spans:
+            max_ends.append(
+                max(span.end, max_ends[-1]) if max_ends else span.end
+            )
+        return OverlapIndex(nodes, [span.start for span in spans], max_ends)
+
+    def overlapping(self, span: Span) -> List[Node]:
+        """
+        Return the nodes that overlap the span, in the same order as they
+        were given.
+        """
+        # Overlapping spans either intersect the span, start where it starts
+        # or end where it ends, so none of them start after it ends or end
+        # before it starts
+        end_index = bisect_right(self._starts, span.end)
+        start_index = bisect_left(self._max_ends, span.start, 0, end_index)
+        return [
+            node
+            for node in self.nodes[start_index:end_index]
+            if span.overlap(Span.from_new(node.hunk)) != Overlap.NO_OVERLAP
+        ]
+
+
 @dataclass
 class DiffSpan:
     old: Span
@@ -264,80 +283,123 @@ class RowLut:
             return new_row
 
 
-def moved_span(new_changes: CommitNodes, old: Span) -> List[Span]:
-    new_change_spans = [
-        DiffSpan.from_hunk(node.hunk) for node in new_changes.nodes
-    ]
+def overhanging(change: DiffSpan, to_update: Span) -> List[Span]:
+    """Return a list of spans that cover the updated span but not the given
+    change.
+    """
+    # to_update: |       [---]
+    # change:    | [---]
+    if change.old.end <= to_update.start:
+        return [to_update]
+    # to_update: |    [---]
+    # change:    | [---]
+    elif (
+        change.old.end <= to_update.end and change.old.start <= to_update.start
+    ):
+        return [Span(change.old.end, to_update.end)]
+    # to_update: |    [---]
+    # change:    |     [-]
+    elif change.old.end <= to_update.end and change.old.start > to_update.start:
+        return [
+            Span(to_update.start, change.old.start),
+            Span(change.old.end, to_update.end),
+        ]
+    # to_update: |    [---]
+    # change:    | [--------]
+    elif (
+        change.old.end >= to_update.end and change.old.start <= to_update.start
+    ):
+        return []
+    # to_update: |    [---]
+    # change:    |      [---]
+    elif change.old.start <= to_update.end:
+        return [Span(to_update.start, change.old.start)]
+    elif change.old.start >= to_update.end:
+        return [to_update]
+    print("unknown case:", change, to_update)
+    assert False
+
+
+@dataclass
+class SpanMover:
+    """
+    Moves spans from before to after the changes of a commit, leaving out the
+    parts that are covered by the changes. Built once per commit and file to
+    move all the spans of the previous generation.
+    """
+
+    _changes: List[DiffSpan]
     # For lookup from old row to new row
-    row_lut = RowLut.from_diff_spans(new_change_spans)
+    _row_lut: RowLut
+    # The indices of the changes sorted by the start of their old span, with
+    # those starts and the largest end of the old spans up to each index
+    _order: List[int]
+    _starts: List[int]
+    _max_ends: List[int]
 
-    def overhanging(change: DiffSpan, to_update: Span) -> List[Span]:
-        """Return a list of spans that cover the updated span but not the given
-        change.
+    @staticmethod
+    def from_commit(new_changes: CommitNodes):
+        changes = [DiffSpan.from_hunk(node.hunk) for node in new_changes.nodes]
+        order = sorted(range(len(changes)), key=lambda i: changes[i].old.start)
+        max_ends = []
+        for i in order:
+            end = changes[i].old.end
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+        return SpanMover(
+            changes,
+            RowLut.from_diff_spans(changes),
+            order,
+            [changes[i].old.start for i in order],
+            max_ends,
+        )
+
+    def relevant_changes(self, old: Span) -> List[DiffSpan]:
         """
-        # to_update: |       [---]
-        # change:    | [---]
-        if change.old.end <= to_update.start:
-            return [to_update]
-        # to_update: |    [---]
-        # change:    | [---]
-        elif (
-            change.old.end <= to_update.end
-            and change.old.start <= to_update.start
-        ):
-            return [Span(change.old.end, to_update.end)]
-        # to_update: |    [---]
-        # change:    |     [-]
-        elif (
-            change.old.end <= to_update.end
-            and change.old.start > to_update.start
-        ):
-            return [
-                Span(to_update.start, change.old.start),
-                Span(change.old.end, to_update.end),
-            ]
-        # to_update: |    [---]
-        # change:    | [--------]
-        elif (
-            change.old.end >= to_update.end
-            and change.old.start <= to_update.start
-        ):
-            return []
-        # to_update: |    [---]
-        # change:    |      [---]
-        elif change.old.start <= to_update.end:
-            return [Span(to_update.start, change.old.start)]
-        elif change.old.start >= to_update.end:
-            return [to_update]
-        print("unknown case:", change, to_update)
-        assert False
-
-    def update(to_update: Span) -> Span:
-        new_start = row_lut.lookup_old_start(to_update.start)
-        new_end = row_lut.lookup_old_end(to_update.end)
-        return Span(new_start, new_end)
-
-    overhang = [old]
-
-    for new_change in new_change_spans:
-        overhang = [
-            span
-            for resulting_span in overhang
-            for span in overhanging(new_change, resulting_span)
+        Return the changes that intersect the span, in their original order.
+        The other changes leave it as it is.
+        """
+        end_index = bisect_left(self._starts, old.end)
+        start_index = bisect_right(self._max_ends, old.start, 0, end_index)
+        return [
+            self._changes[i]
+            for i in sorted(self._order[start_index:end_index])
+            if self._changes[i].old.end > old.start
         ]
-    overhang = [span for span in overhang if not span.is_empty()]
-    updated = [update(span) for span in overhang]
-    if debug.is_logging("update"):
-        debug.get("update").debug("(ov)-> %s", overhang)
-        debug.get("update").debug("moved_span: %s %s", old, new_change_spans)
-        debug.get("update").debug("    -> %s", updated)
-    return updated
+
+    def move(self, old: Span) -> List[Span]:
+        def update(to_update: Span) -> Span:
+            new_start = self._row_lut.lookup_old_start(to_update.start)
+            new_end = self._row_lut.lookup_old_end(to_update.end)
+            return Span(new_start, new_end)
+
+        overhang = [old]
+
+        for new_change in self.relevant_changes(old):
+            overhang = [
+                span
+                for resulting_span in overhang
+                for span in overhanging(new_change, resulting_span)
+            ]
+        overhang = [span for span in overhang if not span.is_empty()]
+        updated = [update(span) for span in overhang]
+        if debug.is_logging("update"):
+            debug.get("update").debug("(ov)-> %s", overhang)
+            debug.get("update").debug("moved_span: %s %s", old, self._changes)
+            debug.get("update").debug("    -> %s", updated)
+        return updated
+
+
+def moved_span(new_changes: CommitNodes, old: Span) -> List[Span]:
+    return SpanMover.from_commit(new_changes).move(old)
 
 
 def add_and_propagate(
-    prev_commit: CommitNodes, commit: CommitNodes
+    prev_commit: CommitNodes,
+    commit: CommitNodes,
+    generation: Optional[int] = None,
 ) -> CommitNodes:
-    generation = prev_commit.nodes[0].generation + 1
+    if generation is None:
+        generation = prev_commit.nodes[0].generation + 1
     prev_commit = CommitNodes(
         [
             node
@@ -350,9 +412,11 @@ def add_and_propagate(
     # 1. empty, add all from commit (supposedly all are active), propagate the
     #    non-overlapping parts of the previous
     # -> row delta computation: start and en separately, common function
+    mover = SpanMover.from_commit(commit)
+
     def propagate(prev_node: Node):
         prev_span = Span.from_new(prev_node.hunk)
-        new_spans = moved_span(commit, prev_span)
+        new_spans = mover.move(prev_span)
         return [
             Node.inactive(prev_span.to_git(), new_span.to_git(), generation)
             for new_span in new_spans
@@ -393,10 +457,7 @@ def update_dangling(file_spg: SPG, nodes: List[Node], generation: int):
 
 
 def update_unchanged_file(file_spg: SPG, generation):
-    prev_nodes_by_new = sorted(
-        [start for start, ends in file_spg.items() if SINK in ends],
-        key=node_by_new,
-    )
+    prev_nodes_by_new = sorted(file_spg.frontier, key=node_by_new)
     if debug.is_logging("update"):
         debug.get("update").debug(
             "propagating unchanged to generation %(generation)s:\n"
@@ -410,6 +471,7 @@ def update_unchanged_file(file_spg: SPG, generation):
         CommitNodes(prev_nodes_by_new),
         # No changes
         CommitNodes([]),
+        generation,
     )
     nodes_by_old = sorted(new_commit.nodes, key=node_by_old)
 
@@ -419,8 +481,13 @@ def update_unchanged_file(file_spg: SPG, generation):
             {"generation": generation, "nodes": pformat(nodes_by_old)},
         )
 
+    prev_index = OverlapIndex.from_nodes_by_new(prev_nodes_by_new)
     for cur_node in nodes_by_old:
-        add_on_top_of(file_spg, prev_nodes_by_new, cur_node)
+        add_on_top_of(
+            file_spg,
+            prev_index.overlapping(Span.from_old(cur_node.hunk)),
+            cur_node,
+        )
 
     update_dangling(file_spg, prev_nodes_by_new, generation)
 
@@ -446,13 +513,10 @@ def update_file(file_spg: SPG, filepatch: Patch, generation: int):
             ],
             key=node_by_old,
         )
-    prev_nodes_by_new = sorted(
-        [start for start, ends in file_spg.items() if SINK in ends],
-        key=node_by_new,
-    )
+    prev_nodes_by_new = sorted(file_spg.frontier, key=node_by_new)
     # Propagate the previous nodes and overwriting with the new ones
     new_commit = add_and_propagate(
-        CommitNodes(prev_nodes_by_new), CommitNodes(nodes_by_old)
+        CommitNodes(prev_nodes_by_new), CommitNodes(nodes_by_old), generation
     )
     nodes_by_old = sorted(new_commit.nodes, key=node_by_old)
 
@@ -462,8 +526,13 @@ def update_file(file_spg: SPG, filepatch: Patch, generation: int):
             f" {pformat(nodes_by_old)}"
         )
 
+    prev_index = OverlapIndex.from_nodes_by_new(prev_nodes_by_new)
     for cur_node in nodes_by_old:
-        add_on_top_of(file_spg, prev_nodes_by_new, cur_node)
+        add_on_top_of(
+            file_spg,
+            prev_index.overlapping(Span.from_old(cur_node.hunk)),
+            cur_node,
+        )
 
     # Not too early, this prepagation is too dumb to be applied to proper
     # nodes
@@ -475,99 +544,80 @@ def update_file(file_spg: SPG, filepatch: Patch, generation: int):
 
 def update_commit_diff(
     spgs: Dict[FileId, SPG],
-    files: Dict[FileId, FileId],
+    renames: RenameIndex,
     commit_diff: CommitDiff,
     diff_i: int,
 ):
-    return update(spgs, files, Diff(commit_diff.filepatches), diff_i)
+    return update(spgs, renames, Diff(commit_diff.filepatches), diff_i)
+
+
+def update_files(
+    renames: RenameIndex, diff: Diff, diff_i: int
+) -> Tuple[List[FileId], List[Tuple[FileId, Patch]]]:
+    """
+    Map the files of the diff to their original files, the ones that their
+    graphs are stored by. Return the original files of the files that are
+    unchanged by the diff, and the original file of each file patch.
+    """
+    assert renames.generations == diff_i
+    unchanged, originals = renames.update(
+        [
+            (filepatch.delta.old_file.path, filepatch.delta.new_file.path)
+            for filepatch in diff
+        ]
+    )
+    if debug.is_logging("update_files"):
+        for original_file_id in unchanged:
+            debug.get("update_files").debug(
+                f"unchanged {original_file_id} in commit {diff_i}"
+            )
+        for original_file_id, filepatch in zip(originals, diff):
+            debug.get("update_files").debug(
+                f"changed {filepatch.delta.new_file.path} in commit {diff_i} "
+                f"with original {original_file_id}"
+            )
+    return unchanged, list(zip(originals, diff))
 
 
-def update(
+def update_unchanged_spg(file_spg: SPG, diff_i: int):
+    # Only the first unchanged generation after a change is added, the nodes
+    # of that one stand in for the following unchanged generations too. Each
+    # of its nodes is propagated one-to-one through those, so no information
+    # is lost. The nodes are expanded again by with_unchanged_generations().
+    if file_spg.last_active_generation == diff_i - 1:
+        update_unchanged_file(file_spg, diff_i)
+
+
+def update_changed_spg(
     spgs: Dict[FileId, SPG],
-    files: Dict[FileId, FileId],
-    diff: Diff,
+    original_file_id: FileId,
+    filepatch: Patch,
     diff_i: int,
 ):
-    def old_patch_file_id(filepatch):
-        return FileId(diff_i - 1, filepatch.delta.old_file.path)
-
-    def new_patch_file_id(filepatch):
-        return FileId(diff_i, filepatch.delta.new_file.path)
-
-    def update_unchanged_files():
-        old_filepaths_of_changed = [
-            filepatch.delta.old_file.path for filepatch in diff
-        ]
-
-        # Propagate the old known files that have not changed
-        def update_unchanged(file_id: FileId):
-            new_file_id = FileId(commit=diff_i, path=file_id.path)
-            files[new_file_id] = files[file_id]
-            if debug.is_logging("update_files"):
-                debug.get("update_files").debug(
-                    f"mapped unchanged {new_file_id} to original {files[file_id]}"
-                )
-            return new_file_id
-
-        return [
-            update_unchanged(file_id)
-            for file_id in list(files.keys())
-            if file_id.commit == diff_i - 1
-            and file_id.path not in old_filepaths_of_changed
-        ]
-
-    def update_changed_files():
-        # Update the files that have changed (are in the diff)
-        def update_changed(filepatch: Patch):
-            old_file_id = old_patch_file_id(filepatch)
-            # Register previously undiscovered file's old name
-            if old_file_id not in files:
-                if debug.is_logging("update_files"):
-                    debug.get("update_files").debug(
-                        f"created undiscovered old {old_file_id}"
-                    )
-                files[old_file_id] = old_file_id
-
-            # Register file's new name
-            new_file_id = new_patch_file_id(filepatch)
-            files[new_file_id] = files[old_file_id]
-            if debug.is_logging("update_files"):
-                debug.get("update_files").debug(
-                    f"mapping changed {new_file_id} "
-                    f"to original {files[old_file_id]} "
-                    f"via {old_file_id}"
-                )
-            return files[new_file_id]
+    if original_file_id not in spgs:
+        spgs[original_file_id] = SPG.empty()
+        file_spg = spgs[original_file_id]
+        # Create nodes for older commits where the file did not exist
+        # yet (=unchanged)
+        if diff_i > 0:
+            update_unchanged_file(file_spg, 0)
+    file_spg = spgs[original_file_id]
+    update_file(file_spg, filepatch, diff_i)
 
-        return [update_changed(filepatch) for filepatch in diff]
 
+def update(
+    spgs: Dict[FileId, SPG],
+    renames: RenameIndex,
+    diff: Diff,
+    diff_i: int,
+):
+    unchanged, changed = update_files(renames, diff, diff_i)
     # Update graph of files that have not changed
-    for file_id in update_unchanged_files():
-        if debug.is_logging("update_files"):
-            debug.get("update_files").debug(
-                f"unchanged {file_id} in commit {diff_i}"
-            )
-        original_file_id = files[file_id]
-        file_spg = spgs[original_file_id]
-        update_unchanged_file(file_spg, diff_i)
-
+    for original_file_id in unchanged:
+        update_unchanged_spg(spgs[original_file_id], diff_i)
     # Update graph of files that have changes (are in the diff)
-    update_changed_files()
-    for filepatch in diff:
-        original_file_id = files[new_patch_file_id(filepatch)]
-        if debug.is_logging("update_files"):
-            debug.get("update_files").debug(
-                f"changed {new_patch_file_id(filepatch)} in commit {diff_i}"
-            )
-        if original_file_id not in spgs:
-            spgs[original_file_id] = SPG.empty()
-            file_spg = spgs[original_file_id]
-            # Create nodes for older commits where the file did not exist
-            # yet (=unchanged)
-            for i in range(diff_i):
-                update_unchanged_file(file_spg, i)
-        file_spg = spgs[original_file_id]
-        update_file(file_spg, filepatch, diff_i)
+    for original_file_id, filepatch in changed:
+        update_changed_spg(spgs, original_file_id, filepatch, diff_i)
 
 
 def node_by_old(node: Node):
@@ -582,3 +632,161 @@ def node_by_new(node: Node):
     return tuple(
         [spans.new.start, spans.old.start, spans.new.end, spans.old.end]
     )
+
+
+@dataclass
+class Checkpoint:
+    """
+    What is needed to undo the update of one generation: the key of the diff
+    that was added and how many SPGs there were before it.
+    """
+
+    key: Optional[Tuple]
+    spgs_count: int
+
+
+# An update of the graph of one file: the generation and the file patch, or
+# None if the file is unchanged in that generation
+SPGUpdate = Tuple[int, Optional[Patch]]
+
+
+def replay_updates(
+    original_file_id: FileId,
+    file_spg: Optional[SPG],
+    updates: List[SPGUpdate],
+) -> SPG:
+    spgs = {} if file_spg is None else {original_file_id: file_spg}
+    for diff_i, filepatch in updates:
+        if filepatch is None:
+            update_unchanged_spg(spgs[original_file_id], diff_i)
+        else:
+            update_changed_spg(spgs, original_file_id, filepatch, diff_i)
+    return spgs[original_file_id]
+
+
+def _replay_updates_in_worker(work) -> List[SPG]:
+    return [replay_updates(*item) for item in work]
+
+
+def balanced_bins(costs: List[int], bin_count: int) -> List[List[int]]:
+    """
+    Distribute the indices of the costs over at most bin_count bins so that
+    the bins get about the same total cost, by putting the largest remaining
+    cost in the bin with the lowest total.
+    """
+    bins = [[] for _ in range(bin_count)]
+    totals = [(0, b) for b in range(bin_count)]
+    for i in sorted(range(len(costs)), key=lambda i: -costs[i]):
+        total, b = heapq.heappop(totals)
+        bins[b].append(i)
+        heapq.heappush(totals, (total + costs[i], b))
+    return [indices for indices in bins if indices]
+
+
+class SPGBuilder(object):
+    """
+    Builds the SPGs of a series of commit diffs and keeps a checkpoint for
+    each generation, so that building them again for a partly changed series
+    only needs to update the generations from the first changed diff and on.
+    Note that the SPGs are modified in place by the next build.
+    With more than one job, the graphs of different files are built in a pool
+    of that many processes, if the diffs are ranges only.
+    """
+
+    def __init__(self, jobs=1):
+        self.jobs = jobs
+        self.spgs: Dict[FileId, SPG] = {}
+        self.renames = RenameIndex()
+        self._checkpoints: List[Checkpoint] = []
+
+    def build(self, diffs: List[CommitDiff]):
+        keys = [diff.key() for diff in diffs]
+        unchanged = 0
+        for checkpoint, key in zip(self._checkpoints, keys):
+            if key is None or checkpoint.key != key:
+                break
+            unchanged += 1
+        self.truncate(unchanged)
+        # The patches of pygit2 diffs cannot be sent to other processes
+        if self.jobs > 1 and all(
+            [isinstance(diff.filepatches, HunkTable) for diff in diffs]
+        ):
+            self._build_in_parallel(diffs, keys, unchanged)
+            return
+        for diff_i in range(unchanged, len(diffs)):
+            self._checkpoints.append(Checkpoint(keys[diff_i], len(self.spgs)))
+            update_commit_diff(self.spgs, self.renames, diffs[diff_i], diff_i)
+            if debug.is_logging("update"):
+                for file_id, spg in self.spgs.items():
+                    debug.get("update").debug(spg.to_dot(file_id))
+                debug.get("update").debug("-------")
+
+    def _build_in_parallel(
+        self, diffs: List[CommitDiff], keys: List[Optional[Tuple]], start: int
+    ):
+        # The graphs of different files do not depend on each other once the
+        # original file of each file patch is known
+        updates: Dict[FileId, List[SPGUpdate]] = {}
+        created: Dict[FileId, None] = {}
+        for diff_i in range(start, len(diffs)):
+            self._checkpoints.append(
+                Checkpoint(keys[diff_i], len(self.spgs) + len(created))
+            )
+            unchanged, changed = update_files(
+                self.renames, Diff(diffs[diff_i].filepatches), diff_i
+            )
+            for original_file_id in unchanged:
+                updates.setdefault(original_file_id, []).append((diff_i, None))
+            for original_file_id, filepatch in changed:
+                if original_file_id not in self.spgs:
+                    created[original_file_id] = None
+                updates.setdefault(original_file_id, []).append(
+                    (diff_i, filepatch)
+                )
+        work = [
+            (original_file_id, self.spgs.get(original_file_id), file_updates)
+            for original_file_id, file_updates in updates.items()
+        ]
+        costs = [
+            sum(
+                [
+                    1 + (len(filepatch.hunks) if filepatch is not None else 0)
+                    for _, filepatch in file_updates
+                ]
+            )
+            + (len(file_spg.frontier) if file_spg is not None else 0)
+            for _, file_spg, file_updates in work
+        ]
+        bins = balanced_bins(costs, self.jobs)
+        built: Dict[FileId, SPG] = {}
+        if len(bins) > 1:
+            with ProcessPoolExecutor(max_workers=len(bins)) as executor:
+                results = executor.map(
+                    _replay_updates_in_worker,
+                    [[work[i] for i in indices] for indices in bins],
+                )
+                for indices, file_spgs in zip(bins, results):
+                    for i, file_spg in zip(indices, file_spgs):
+                        built[work[i][0]] = file_spg
+        else:
+            for item in work:
+                built[item[0]] = replay_updates(*item)
+        # Keep the graphs in the order they were created in
+        for original_file_id in list(self.spgs.keys()) + list(created.keys()):
+            if original_file_id in built:
+                self.spgs[original_file_id] = built[original_file_id]
+
+    def truncate(self, generation: int):
+        """
+        Restore the SPGs and renames to how they were before the given
+        generation was added.
+        """
+        if generation >= len(self._checkpoints):
+            return
+        checkpoint = self._checkpoints[generation]
+        self.renames.truncate(generation)
+        for file_id in list(self.spgs.keys())[checkpoint.spgs_count :]:
+            del self.spgs[file_id]
+        for spg in self.spgs.values():
+            spg.truncate(generation)
+        del self._checkpoints[generation:]
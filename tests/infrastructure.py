@@ -16,13 +16,20 @@
 import os
 import shutil
 import stat
+from dataclasses import dataclass
 from os.path import basename
+from typing import List
 
 import native_git
 import pygit2
 
 from fragmap.common_ui import first_line
-from fragmap.load_commits import STAGED_HEX, UNSTAGED_HEX
+from fragmap.load_commits import (
+    STAGED_HEX,
+    UNSTAGED_HEX,
+    CommitLoader,
+    ExplicitCommitSelection,
+)
 
 try:
     # Ownership check may flag directories in network drive mounts
@@ -31,6 +38,8 @@ try:
 except AttributeError:
     pass
 
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+
 
 def subdirs(dir_path):
     for e in os.walk(dir_path):
@@ -141,6 +150,60 @@ def find_commit_with_message(repo_path, message):
     )
 
 
+@dataclass(frozen=True)
+class BuiltRepo:
+    """
+    A test repo in diffs/build and the messages of the commits to load from
+    it, in order.
+    """
+
+    name: str
+    commit_messages: List[str]
+
+    @property
+    def path(self):
+        return os.path.join(TEST_DIR, "diffs", "build", self.name)
+
+    def commit_hexes(self):
+        return [
+            find_commit_with_message(self.path, message)
+            for message in self.commit_messages
+        ]
+
+    def load(self, **kwargs):
+        """
+        Load the diffs of the commits, see CommitLoader.load().
+        """
+        return CommitLoader.load(
+            self.path, ExplicitCommitSelection(self.commit_hexes()), **kwargs
+        )
+
+
+# One file with lines that are added and modified
+ADDMOD_REPO = BuiltRepo(
+    "test_030_033",
+    [
+        "030-addmod-create-with-ab",
+        "031-addmod-add-c",
+        "032-addmod-change-bc-to-xy",
+        "033-addmod-add-z-between-xy",
+    ],
+)
+# One file changed by the first commit and another by the rest
+TWOFILES_REPO = BuiltRepo(
+    "test_050_054",
+    [
+        "050-twofiles-create-a-with-a",
+        "051-twofiles-create-b-with-x",
+        "052-twofiles-add-y-to-b",
+        "053-twofiles-add-z-to-b",
+        "054-twofiles-add-w-to-b",
+    ],
+)
+# One commit to make staged and unstaged changes on top of
+STAGED_REPO = BuiltRepo("test_staged", ["Setup"])
+
+
 def stage_all_changes(repo_path):
     repo = pygit2.Repository(repo_path)
     repo.index.add_all()
@@ -22,6 +22,7 @@ from fragmap.generate_matrix import (
     ConnectionStatus,
     SingleNodeCell,
     Status9Neighborhood,
+    Viewport,
 )
 
 # Test helpers
@@ -225,6 +226,32 @@ class ConnectionTest(unittest.TestCase):
             ["12", "11 "],
         )
 
+    def test_cells_created_on_access(self):
+        matrix = ConnectedFragmap(
+            FakeFragmap(create_node_matrix_from_description(["12", "^1"]))
+        ).generate_matrix()
+        row = matrix[1]
+        self.assertEqual(2, len(row))
+        self.assertEqual(list(row), [row[0], row[-1]])
+        self.assertEqual(list(row), row[:])
+        self.assertEqual(
+            SingleNodeCell(CellKind.CHANGE, None, "1"), row[1].base
+        )
+        self.assertEqual(ConnectionStatus.CONNECTION, row[1].changes.up)
+        self.assertEqual(ConnectionStatus.INFILL, row[0].changes.center)
+        with self.assertRaises(IndexError):
+            row[2]
+
+    def test_render_viewport(self):
+        fragmap = ConnectedFragmap(
+            FakeFragmap(create_node_matrix_from_description(["12", "11 "]))
+        )
+        rendered = fragmap.render_for_console(False)
+        self.assertEqual(
+            [row[3:6] for row in rendered[3:6]],
+            fragmap.render_for_console(False, Viewport(1, 1, 1, 1)),
+        )
+
     def check_matrix(self, expected_connection_matrix, node_matrix):
         matrix = create_node_matrix_from_description(node_matrix)
         connected_fragmap = ConnectedFragmap(FakeFragmap(matrix))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import random
+import re
+import unittest
+
+from infrastructure import TWOFILES_REPO
+
+from fragmap.console_ui import Repainter, ViewportError, render_fragmap_lines
+from fragmap.generate_matrix import Fragmap, Viewport
+
+
+class FakeConsole(object):
+    """
+    Interprets the output of a Repainter like a console would.
+    """
+
+    def __init__(self):
+        self.lines = [""]
+        self.row = 0
+        self.column = 0
+
+    def write(self, text):
+        for token in re.findall(r"\033\[(\d*)([ABK])|(\r)|(\n)|(.)", text):
+            count, command, carriage_return, newline, character = token
+            if command == "A":
+                self.row -= int(count)
+            elif command == "B":
+                self.row += int(count)
+            elif command == "K":
+                self.lines[self.row] = self.lines[self.row][: self.column]
+            elif carriage_return:
+                self.column = 0
+            elif newline:
+                self.row += 1
+                self.column = 0
+                if self.row == len(self.lines):
+                    self.lines.append("")
+            else:
+                line = self.lines[self.row].ljust(self.column)
+                self.lines[self.row] = (
+                    line[: self.column] + character + line[self.column + 1 :]
+                )
+                self.column += 1
+            assert 0 <= self.row < len(self.lines)
+
+
+class RenderFragmapLinesTest(unittest.TestCase):
+    def test_column_offset_past_last_column(self):
+        fragmap = Fragmap.from_diffs(TWOFILES_REPO.load(ranges_only=True))
+        lines, _ = render_fragmap_lines(
+            fragmap, False, Viewport(column_offset=4)
+        )
+        self.assertEqual(5, len(lines))
+        with self.assertRaises(ViewportError):
+            render_fragmap_lines(fragmap, False, Viewport(column_offset=5))
+
+
+class RepainterTest(unittest.TestCase):
+    def test_same_as_printing_again(self):
+        random.seed(0)
+        console = FakeConsole()
+        repainter = Repainter()
+        for _ in range(50):
+            lines = [
+                random.choice(["#..", ".#.", "..#", "##"])
+                for _ in range(random.randint(0, 6))
+            ]
+            console.write(repainter.repaint(lines))
+            self.assertEqual(len(lines), console.row)
+            self.assertEqual(lines, console.lines[: len(lines)])
+            self.assertEqual(
+                [""] * (len(console.lines) - len(lines)),
+                console.lines[len(lines) :],
+            )
+
+    def test_only_changed_lines_are_written(self):
+        repainter = Repainter()
+        repainter.repaint(["#..", ".#.", "..#"])
+        # Up to the changed line and back down below the lines
+        self.assertEqual(
+            "\033[2A\r##.\033[K\033[2B\r",
+            repainter.repaint(["#..", "##.", "..#"]),
+        )
+        self.assertEqual("\r", repainter.repaint(["#..", "##.", "..#"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import unittest
+
+import pygit2
+from infrastructure import ADDMOD_REPO
+from mock import patch
+
+from fragmap.commitdiff import HunkTable
+from fragmap.diff_cache import DiffCache
+from fragmap.generate_matrix import Fragmap
+from fragmap.load_commits import get_diff
+
+
+class DiffCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = pygit2.Repository(ADDMOD_REPO.path)
+        self.commits = [
+            self.repo[commit_hex] for commit_hex in ADDMOD_REPO.commit_hexes()
+        ]
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = DiffCache(cache_dir)
+            for commit in self.commits:
+                key = DiffCache.key(commit)
+                self.assertIsNone(cache.lookup(key))
+                diff = HunkTable.from_diff(get_diff(self.repo, commit))
+                cache.store(key, diff)
+                self.assertEqual(diff, cache.lookup(key))
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = DiffCache(cache_dir)
+            keys = [DiffCache.key(commit) for commit in self.commits]
+            for i, (key, commit) in enumerate(zip(keys, self.commits)):
+                cache.store(
+                    key, HunkTable.from_diff(get_diff(self.repo, commit))
+                )
+                os.utime(cache._entry_path(key), (i, i))
+            sizes = [os.path.getsize(cache._entry_path(key)) for key in keys]
+            cache.max_bytes = sum(sizes[2:])
+            cache.evict()
+            self.assertEqual(
+                [False, False, True, True],
+                [cache.lookup(key) is not None for key in keys],
+            )
+
+    def test_cached_load_gives_same_fragmap(self):
+        uncached = Fragmap.from_diffs(ADDMOD_REPO.load())
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = DiffCache(cache_dir)
+            with patch.object(DiffCache, "for_repository", return_value=cache):
+                first = ADDMOD_REPO.load(use_cache=True)
+                for commit in self.commits:
+                    self.assertTrue(
+                        os.path.exists(cache._entry_path(DiffCache.key(commit)))
+                    )
+                with patch(
+                    "fragmap.load_commits.get_diff", wraps=get_diff
+                ) as computed:
+                    second = ADDMOD_REPO.load(use_cache=True)
+                    computed.assert_not_called()
+        for diffs in [first, second]:
+            self.assertEqual(
+                uncached.render_for_console(False),
+                Fragmap.from_diffs(diffs).render_for_console(False),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+import unittest
+
+from infrastructure import ADDMOD_REPO
+
+from fragmap.enumerate_paths import all_paths
+from fragmap.spg import SINK, SOURCE, SPG, CompactSPG, Node
+from fragmap.update import SPGBuilder
+
+
+def all_paths_by_brute_force(spg: SPG):
+    def paths_from(node):
+        if node == SINK:
+            return [[node]]
+        return [
+            [node] + path
+            for end in CompactSPG.from_spg(spg).graph[node]
+            for path in paths_from(end)
+        ]
+
+    known_keys = set()
+    for path in paths_from(SOURCE):
+        key = tuple([node for node in path if node.is_active])
+        if key and key not in known_keys:
+            known_keys.add(key)
+            yield path
+
+
+def diamond_chain(length: int) -> SPG:
+    # Two inactive nodes in each generation, each with edges to both nodes of
+    # the next generation, and an active node at the end
+    spg = SPG.empty()
+    prev_nodes = [SOURCE]
+    for generation in range(length):
+        nodes = [
+            Node.inactive((row, 1), (row, 1), generation) for row in [1, 3]
+        ]
+        for prev_node in prev_nodes:
+            for node in nodes:
+                spg.register(prev_node, node)
+        prev_nodes = nodes
+    active = Node.active(Node.inactive((1, 3), (1, 3), 0).hunk, length)
+    for prev_node in prev_nodes:
+        spg.register(prev_node, active)
+    spg.register(active, SINK)
+    return spg
+
+
+class AllPathsTest(unittest.TestCase):
+    def test_same_as_brute_force(self):
+        builder = SPGBuilder()
+        builder.build(ADDMOD_REPO.load(ranges_only=True))
+        for spg in builder.spgs.values():
+            self.assertEqual(
+                list(all_paths_by_brute_force(spg)), list(all_paths(spg))
+            )
+
+    def test_merges_paths_through_diamonds(self):
+        self.assertEqual(
+            list(all_paths_by_brute_force(diamond_chain(4))),
+            list(all_paths(diamond_chain(4))),
+        )
+        # Too many paths to enumerate one by one
+        self.assertEqual(1, len(list(all_paths(diamond_chain(200)))))
+
+    def test_skips_paths_without_active_nodes(self):
+        spg = diamond_chain(4)
+        inactive = Node.inactive((5, 1), (5, 1), 0)
+        spg.register(SOURCE, inactive)
+        spg.register(inactive, SINK)
+        compact = CompactSPG.from_spg(spg)
+        self.assertFalse(compact.reaches_active[compact.node_id(inactive)])
+        self.assertTrue(compact.reaches_active[compact.source])
+        self.assertEqual(
+            [path for path in all_paths(diamond_chain(4))], list(all_paths(spg))
+        )
+        self.assertEqual([], list(all_paths(SPG.empty())))
+
+    def test_longer_than_recursion_limit(self):
+        generations = sys.getrecursionlimit() + 1
+        (path,) = list(all_paths(diamond_chain(generations)))
+        self.assertEqual(generations + 3, len(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
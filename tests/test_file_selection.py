@@ -13,10 +13,11 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+import tempfile
 import unittest
-from pathlib import PurePath
 
-from fragmap.file_selection import FilePatterns, FileSelection, file_matches
+from fragmap.file_selection import FilePatterns, FileSelection
 from fragmap.spg import FileId
 
 
@@ -26,6 +27,29 @@ class FileSelectionTest(unittest.TestCase):
         self.assertTrue(fp.matches("file.txt"))
         self.assertFalse(fp.matches("other.txt"))
 
+    def test_glob_patterns(self):
+        fp = FilePatterns.from_files_arg(["src/*.py", "**/test_?.c", "doc/**"])
+        self.assertTrue(fp.matches("src/a.py"))
+        self.assertTrue(fp.matches("src/a.py/b.txt"))
+        self.assertFalse(fp.matches("src/a.c"))
+        self.assertFalse(fp.matches("lib/src/a.py"))
+        self.assertTrue(fp.matches("test_1.c"))
+        self.assertTrue(fp.matches("lib/deep/test_1.c"))
+        self.assertFalse(fp.matches("lib/test_12.c"))
+        self.assertTrue(fp.matches("doc/a/b.md"))
+        self.assertFalse(fp.matches("docs/a.md"))
+
+    def test_existing_file_with_glob_characters(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            path = os.path.join(cwd, "a[1].txt")
+            open(path, "w").close()
+            fp = FilePatterns.from_files_arg(["a[1].txt"], cwd)
+            self.assertTrue(fp.matches(path))
+            self.assertFalse(fp.matches(os.path.join(cwd, "a1.txt")))
+        fp = FilePatterns.from_files_arg(["b[[]1].txt"])
+        self.assertTrue(fp.matches("b[1].txt"))
+        self.assertFalse(fp.matches("b1.txt"))
+
 
 class FilePatternsTest(unittest.TestCase):
     def test_matches_absolute_file(self):
@@ -46,7 +70,7 @@ class FilePatternsTest(unittest.TestCase):
         self.assertFalse(self.file_matches("d/s/f.txt", "f.txt"))
 
     def file_matches(self, path, pattern):
-        return file_matches(PurePath(path), PurePath(pattern))
+        return FilePatterns.from_files_arg([pattern]).matches(path)
 
 
 if __name__ == "__main__":
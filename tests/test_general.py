@@ -510,3 +510,12 @@ class Test(unittest.TestCase):
         diffs = cl.load(repo_path, all_commits_in_repo)
         h = Fragmap.from_diffs(diffs, file_arg)
         self.assertEqual(set(h.spgs.keys()), expected_ids)
+        # Dropping the unselected files while loading gives the same result
+        selected_diffs = cl.load(
+            repo_path, all_commits_in_repo, files_arg=file_arg
+        )
+        selected = Fragmap.from_diffs(selected_diffs, file_arg)
+        self.assertEqual(set(selected.spgs.keys()), expected_ids)
+        self.assertEqual(
+            h.render_for_console(False), selected.render_for_console(False)
+        )
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import random
+import unittest
+
+from infrastructure import ADDMOD_REPO
+
+from fragmap.console_ui import filter_consecutive_equal_columns
+from fragmap.generate_matrix import (
+    BriefFragmap,
+    Cell,
+    CellKind,
+    ConnectedFragmap,
+    Fragmap,
+    GraphPath,
+    KindMatrix,
+    LazyKindMatrix,
+    RowMajorMatrix,
+    SquashablePair,
+    Viewport,
+    changes_by_row,
+    find_squashable,
+    render_kinds_for_console,
+)
+from fragmap.spg import FileId, Node
+
+
+def random_matrix(rows, columns):
+    return RowMajorMatrix(
+        [
+            [
+                Cell(
+                    CellKind.CHANGE
+                    if random.random() < 0.3
+                    else CellKind.NO_CHANGE
+                )
+                for _ in range(columns)
+            ]
+            for _ in range(rows)
+        ]
+    )
+
+
+def find_squashable_by_sets(m):
+    def changes_at_row(r):
+        return set(
+            [c for c, cell in enumerate(m[r]) if cell.kind == CellKind.CHANGE]
+        )
+
+    for r in range(len(m)):
+        for earlier_r in reversed(range(r)):
+            if any(
+                [
+                    changes_at_row(row_i) & changes_at_row(r)
+                    for row_i in range(earlier_r + 1, r)
+                ]
+            ):
+                break
+            if not (changes_at_row(r) - changes_at_row(earlier_r)):
+                yield SquashablePair(earlier_row=earlier_r, row=r)
+
+
+class FindSquashableTest(unittest.TestCase):
+    def test_changes_by_row(self):
+        m = RowMajorMatrix(
+            [
+                [Cell(CellKind.CHANGE), Cell(CellKind.NO_CHANGE)],
+                [Cell(CellKind.BETWEEN_CHANGES), Cell(CellKind.CHANGE)],
+            ]
+        )
+        self.assertEqual([0b01, 0b10], changes_by_row(m))
+        self.assertEqual([], changes_by_row(RowMajorMatrix([])))
+
+    def test_same_as_with_sets(self):
+        random.seed(0)
+        for _ in range(50):
+            m = random_matrix(random.randint(0, 12), random.randint(0, 6))
+            self.assertEqual(
+                list(find_squashable_by_sets(m)), list(find_squashable(m))
+            )
+
+
+def kind_matrix(m):
+    rows = len(m)
+    columns = len(m[0]) if rows else 0
+    return KindMatrix(
+        bytearray([cell.kind.value for row in m for cell in row]),
+        nodes=[None] * (rows * columns),
+        file_ids=[None] * (rows * columns),
+        n_rows=rows,
+        n_columns=columns,
+        row_stride=columns,
+        column_stride=1,
+    )
+
+
+KIND_CHARACTERS = {
+    "#": CellKind.CHANGE,
+    "|": CellKind.BETWEEN_CHANGES,
+    "^": CellKind.BETWEEN_SQUASHABLE,
+    ".": CellKind.NO_CHANGE,
+}
+
+
+def cells_from_description(description):
+    return RowMajorMatrix(
+        [[Cell(KIND_CHARACTERS[c]) for c in row] for row in description]
+    )
+
+
+def description_from_kinds(m):
+    characters = {kind: c for c, kind in KIND_CHARACTERS.items()}
+    return ["".join([characters[kind] for kind in row]) for row in kinds(m)]
+
+
+def kinds(m):
+    return [[m.kind(r, c) for c in range(m.n_columns)] for r in range(len(m))]
+
+
+class KindMatrixTest(unittest.TestCase):
+    def test_views(self):
+        random.seed(0)
+        cells = random_matrix(4, 3)
+        m = kind_matrix(cells)
+        self.assertEqual(
+            [[cell.kind for cell in row] for row in cells], kinds(m)
+        )
+        transposed = m.transposed()
+        self.assertEqual((3, 4), (len(transposed), transposed.n_columns))
+        self.assertEqual(
+            [list(column) for column in zip(*kinds(m))], kinds(transposed)
+        )
+        self.assertEqual(kinds(m)[1:3], kinds(m.row_range(1, 3)))
+        self.assertEqual(
+            [row[1:3] for row in kinds(m)], kinds(m.column_range(1, 3))
+        )
+        self.assertEqual(
+            kinds(transposed)[1:2], kinds(transposed.row_range(1, 2))
+        )
+        self.assertEqual(m.transposed().row(1), m.column(1))
+        # Views share the storage
+        transposed.set_kind(2, 1, CellKind.BETWEEN_SQUASHABLE)
+        self.assertEqual(CellKind.BETWEEN_SQUASHABLE, m.kind(1, 2))
+
+    def test_decorate(self):
+        description = ["#.#", "...", "##.", "..#", ".#."]
+        # Column 2 between rows 0 and 3 and column 1 between rows 2 and 4
+        # are squashable
+        expected = ["#.#", "|.^", "##^", ".^#", ".#."]
+        m = kind_matrix(cells_from_description(description))
+        # The same matrix stored column major
+        columns = kind_matrix(
+            cells_from_description(["".join(c) for c in zip(*description)])
+        ).transposed()
+        m.decorate()
+        columns.decorate()
+        self.assertEqual(expected, description_from_kinds(m))
+        self.assertEqual(expected, description_from_kinds(columns))
+
+    def test_decorate_same_for_both_layouts(self):
+        random.seed(0)
+        for _ in range(50):
+            cells = random_matrix(random.randint(0, 12), random.randint(1, 6))
+            m = kind_matrix(cells)
+            columns = kind_matrix(
+                RowMajorMatrix([list(column) for column in zip(*cells)])
+            ).transposed()
+            m.decorate()
+            columns.decorate()
+            self.assertEqual(kinds(m), kinds(columns))
+
+
+class ViewportTest(unittest.TestCase):
+    def test_renders_window(self):
+        random.seed(0)
+        m = kind_matrix(random_matrix(5, 7))
+        m.decorate()
+        rendered = render_kinds_for_console(m, False)
+        for viewport, rows, columns in [
+            (Viewport(), slice(0, 5), slice(0, 7)),
+            (Viewport(1, 2, 3, 4), slice(1, 4), slice(2, 6)),
+            (
+                Viewport(column_offset=5, max_columns=4),
+                slice(0, 5),
+                slice(5, 7),
+            ),
+            (Viewport(row_offset=9, column_offset=9), slice(0, 0), slice(0, 0)),
+        ]:
+            self.assertEqual(
+                [row[columns] for row in rendered[rows]],
+                render_kinds_for_console(m, False, viewport),
+                viewport,
+            )
+
+    def test_pages_of_distinct_columns(self):
+        random.seed(0)
+        m = kind_matrix(random_matrix(5, 20))
+        m.decorate()
+        columns = m.distinct_columns()
+        full = render_kinds_for_console(m, False, Viewport(), columns)
+        merged = filter_consecutive_equal_columns(
+            render_kinds_for_console(m, False)
+        )
+        self.assertEqual([list(row) for row in merged], full)
+        pages = [
+            render_kinds_for_console(
+                m, False, Viewport(column_offset=offset, max_columns=3), columns
+            )
+            for offset in range(0, len(columns), 3)
+        ]
+        self.assertEqual(
+            ["".join(row) for row in full],
+            ["".join(["".join(page[r]) for page in pages]) for r in range(5)],
+        )
+
+
+def signature_graph_path(n_rows):
+    # A path with changes in the generations of the signature
+    def graph_path(file_id, spg, signature):
+        return GraphPath(
+            [Node(None, -1, False)]
+            + [Node(None, r, bool(signature & 1 << r)) for r in range(n_rows)]
+            + [Node(None, n_rows, False)],
+            file_id,
+        )
+
+    return graph_path
+
+
+class LazyKindMatrixTest(unittest.TestCase):
+    def test_same_as_kind_matrix(self):
+        random.seed(0)
+        for _ in range(30):
+            n_rows = random.randint(1, 8)
+            choices = [random.randrange(1 << n_rows) for _ in range(4)]
+            signed_paths = [
+                (signature, FileId(0, str(c // 3)), None, signature)
+                for c, signature in enumerate(
+                    [
+                        random.choice(choices)
+                        for _ in range(random.randint(0, 9))
+                    ]
+                )
+            ]
+            graph_path = signature_graph_path(n_rows)
+            full = KindMatrix.from_columns(
+                [graph_path(*signed_path[1:]) for signed_path in signed_paths]
+            )
+            m = full.row_range(1, n_rows + 1)
+            m.decorate()
+            columns = m.distinct_columns()
+            for block_columns in [1, 2, 256]:
+                lazy = LazyKindMatrix.from_signed_paths(
+                    signed_paths, n_rows, graph_path, block_columns
+                )
+                self.assertEqual(len(columns), lazy.n_columns)
+                for viewport in [Viewport(), Viewport(1, 2, 3, 4)]:
+                    self.assertEqual(
+                        render_kinds_for_console(m, False, viewport, columns),
+                        lazy.render_for_console(False, viewport),
+                    )
+                for c, column in enumerate(columns):
+                    self.assertEqual(m.file_id(0, column), lazy.file_id(c))
+
+    def test_same_as_fragmaps(self):
+        fragmap = Fragmap.from_diffs(ADDMOD_REPO.load(ranges_only=True))
+        for f in [fragmap, BriefFragmap(fragmap)]:
+            m = f.generate_kind_matrix()
+            columns = m.distinct_columns()
+            lazy = f.generate_lazy_kind_matrix()
+            self.assertEqual(
+                render_kinds_for_console(m, False, Viewport(), columns),
+                lazy.render_for_console(False),
+            )
+            for r in range(m.n_rows):
+                for c, column in enumerate(columns):
+                    self.assertEqual(m.cell(r, column), lazy.cell(r, c))
+
+
+class CachedProductsTest(unittest.TestCase):
+    def test_shared(self):
+        fragmap = Fragmap.from_diffs([])
+        brief = BriefFragmap(fragmap)
+        connected = ConnectedFragmap(brief)
+        kind_matrix = fragmap.generate_kind_matrix()
+        matrices = [brief.generate_matrix(), connected.generate_matrix()]
+        self.assertIs(kind_matrix, fragmap.generate_kind_matrix())
+        self.assertIs(matrices[0], brief.generate_matrix())
+        self.assertIs(matrices[1], connected.generate_matrix())
+        # Each fragmap keeps its own products
+        self.assertIsNot(
+            fragmap.generate_matrix(), Fragmap.from_diffs([]).generate_matrix()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import unittest
+
+import pygit2
+from infrastructure import (
+    ADDMOD_REPO,
+    STAGED_REPO,
+    TWOFILES_REPO,
+    reset_hard,
+    stage_all_changes,
+)
+
+from fragmap.commitdiff import HunkTable
+from fragmap.generate_matrix import Fragmap
+from fragmap.load_commits import (
+    STAGED_HEX,
+    UNSTAGED_HEX,
+    CommitSelection,
+    CommitSelectionError,
+)
+
+
+class CommitLoaderTest(unittest.TestCase):
+    def test_ranges_only_load(self):
+        full = TWOFILES_REPO.load()
+        ranges = TWOFILES_REPO.load(ranges_only=True)
+        for diff in ranges:
+            self.assertIsInstance(diff.filepatches, HunkTable)
+        self.assertEqual(
+            Fragmap.from_diffs(full).render_for_console(False),
+            Fragmap.from_diffs(ranges).render_for_console(False),
+        )
+
+    def test_parallel_load_keeps_commit_order(self):
+        serial = TWOFILES_REPO.load()
+        parallel = TWOFILES_REPO.load(jobs=3)
+        self.assertEqual(
+            TWOFILES_REPO.commit_hexes(),
+            [str(diff.header.id) for diff in parallel],
+        )
+        self.assertEqual(
+            Fragmap.from_diffs(serial).render_for_console(False),
+            Fragmap.from_diffs(parallel).render_for_console(False),
+        )
+
+
+class CommitSelectionTest(unittest.TestCase):
+    def test_last_commits(self):
+        self.assertEqual(["032", "033"], self.selected(None, None, 2))
+
+    def test_max_count_beyond_root(self):
+        self.assertEqual(
+            ["030", "031", "032", "033"], self.selected(None, None, 10)
+        )
+
+    def test_since(self):
+        self.assertEqual(
+            ["030", "031", "032", "033"], self.selected("HEAD~4", None, None)
+        )
+
+    def test_since_with_max_count(self):
+        self.assertEqual(["030", "031"], self.selected("HEAD~4", None, 2))
+
+    def test_since_until(self):
+        self.assertEqual(
+            ["031", "032"], self.selected("HEAD~3", "HEAD~1", None)
+        )
+
+    def test_until_before_since(self):
+        with self.assertRaises(CommitSelectionError):
+            self.selected("HEAD~1", "HEAD~2", None)
+
+    def test_since_head(self):
+        self.assertEqual([], self.selected("HEAD", None, None))
+
+    def test_since_until_same_commit(self):
+        self.assertEqual([], self.selected("HEAD~1", "HEAD~1", None))
+
+    def test_since_head_without_changes(self):
+        reset_hard(STAGED_REPO.path)
+        self.assertEqual([], self.selected_in_staged_repo())
+
+    def test_since_head_with_staged_and_unstaged(self):
+        reset_hard(STAGED_REPO.path)
+        self.addCleanup(reset_hard, STAGED_REPO.path)
+        self.change_file(["hello", "world", "staged"])
+        stage_all_changes(STAGED_REPO.path)
+        self.change_file(["hello", "unstaged"])
+        self.assertEqual(
+            [STAGED_HEX, UNSTAGED_HEX], self.selected_in_staged_repo()
+        )
+
+    def change_file(self, lines):
+        with open(
+            os.path.join(STAGED_REPO.path, "file.txt"), "w", newline="\n"
+        ) as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def selected_in_staged_repo(self):
+        repo = pygit2.Repository(STAGED_REPO.path)
+        selection = CommitSelection("HEAD", None, None, True, True)
+        return [str(commit.id) for commit in selection.get_items(repo)]
+
+    def selected(self, since_ref, until_ref, max_count):
+        repo = pygit2.Repository(ADDMOD_REPO.path)
+        selection = CommitSelection(
+            since_ref, until_ref, max_count, False, False
+        )
+        return [commit.message[0:3] for commit in selection.get_items(repo)]
+
+
+if __name__ == "__main__":
+    unittest.main()
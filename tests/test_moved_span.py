@@ -18,7 +18,7 @@ from math import inf
 
 from fragmap.span import Span
 from fragmap.spg import CommitNodes, DiffHunk, Node
-from fragmap.update import moved_span
+from fragmap.update import DiffSpan, SpanMover, moved_span, overhanging
 
 
 class MovedSpanTest(unittest.TestCase):
@@ -32,6 +32,34 @@ class MovedSpanTest(unittest.TestCase):
         changes = CommitNodes([node(True, Span(10, 10), Span(10, 25))])
         self.assertEqual([Span(28, 29)], moved_span(changes, Span(13, 14)))
 
+    def test_only_intersecting_changes_matter(self):
+        changes = CommitNodes(
+            [
+                node(True, Span(8, 10), Span(8, 9)),
+                node(True, Span(2, 2), Span(2, 4)),
+                node(True, Span(4, 6), Span(6, 9)),
+                node(True, Span(12, 12), Span(15, 15)),
+            ]
+        )
+        mover = SpanMover.from_commit(changes)
+        all_changes = [DiffSpan.from_hunk(n.hunk) for n in changes.nodes]
+        for start in range(0, 15):
+            for end in range(start, 15):
+                old = Span(start, end)
+                self.assertEqual(
+                    self.overhang(all_changes, old),
+                    self.overhang(mover.relevant_changes(old), old),
+                    old,
+                )
+
+    def overhang(self, changes, old):
+        spans = [old]
+        for change in changes:
+            spans = [
+                piece for span in spans for piece in overhanging(change, span)
+            ]
+        return [span for span in spans if not span.is_empty()]
+
 
 def node(active: bool, old: Span, new: Span):
     if active:
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import copy
+import unittest
+
+from fragmap.renames import RenameIndex
+from fragmap.spg import FileId
+
+# The old and new path of each file patch of each generation
+DELTA_PATHS = [
+    [("a", "a"), ("b", "b")],
+    [("a", "c")],
+    [("b", "b")],
+    [("c", "d"), ("a", "a")],
+]
+
+
+class RenameIndexTest(unittest.TestCase):
+    def test_follows_renames(self):
+        renames = RenameIndex()
+        originals = [renames.update(paths)[1] for paths in DELTA_PATHS]
+        a = FileId(-1, "a")
+        b = FileId(-1, "b")
+        new_a = FileId(2, "a")
+        self.assertEqual([[a, b], [a], [b], [a, new_a]], originals)
+        self.assertEqual(["a", "c", "d"], list(renames.paths(a)))
+        self.assertEqual(["a"], list(renames.paths(new_a)))
+
+    def test_unchanged_after_change(self):
+        renames = RenameIndex()
+        unchanged = [renames.update(paths)[0] for paths in DELTA_PATHS]
+        # Only files that were changed by the previous generation are listed
+        b = FileId(-1, "b")
+        self.assertEqual([[], [b], [FileId(-1, "a")], [b]], unchanged)
+
+    def test_truncate(self):
+        renames = RenameIndex()
+        snapshots = []
+        for paths in DELTA_PATHS:
+            snapshots.append(copy.deepcopy(renames))
+            renames.update(paths)
+        for generation in reversed(range(len(DELTA_PATHS))):
+            renames.truncate(generation)
+            self.assertEqual(snapshots[generation], renames)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pickle
+import unittest
+
+from infrastructure import ADDMOD_REPO
+
+from fragmap.spg import CompactSPG, FileId
+from fragmap.update import SPGBuilder, node_by_new
+
+
+class CompactSPGTest(unittest.TestCase):
+    def setUp(self):
+        builder = SPGBuilder()
+        builder.build(ADDMOD_REPO.load(ranges_only=True))
+        self.spgs = list(builder.spgs.values())
+
+    def test_same_nodes_and_edges(self):
+        for spg in self.spgs:
+            compact = CompactSPG.from_spg(spg)
+            self.assertEqual(list(spg.nodes()), list(compact.nodes()))
+            self.assertEqual(
+                {
+                    node: sorted(ends, key=node_by_new)
+                    for node, ends in spg.items()
+                },
+                {node: list(ends) for node, ends in compact.items()},
+            )
+            for node in spg.nodes():
+                self.assertEqual(
+                    spg.downstream_from_active[node],
+                    compact.downstream_from_active[node],
+                )
+
+    def test_same_commits_and_dot(self):
+        for spg in self.spgs:
+            compact = CompactSPG.from_spg(spg)
+            self.assertEqual(spg.commits(), compact.commits())
+            self.assertEqual(
+                sorted(spg.to_dot(FileId(0, "file")).splitlines()),
+                sorted(compact.to_dot(FileId(0, "file")).splitlines()),
+            )
+
+    def test_node_id(self):
+        for spg in self.spgs:
+            compact = CompactSPG.from_spg(spg)
+            for i in range(len(compact)):
+                self.assertEqual(i, compact.node_id(compact.node(i)))
+
+    def test_pickle(self):
+        for spg in self.spgs:
+            compact = CompactSPG.from_spg(spg)
+            self.assertEqual(compact, pickle.loads(pickle.dumps(compact)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from infrastructure import TWOFILES_REPO
+
+from fragmap.generate_matrix import Fragmap
+from fragmap.tui import FragmapView
+
+
+class FragmapViewTest(unittest.TestCase):
+    def setUp(self):
+        diffs = TWOFILES_REPO.load(ranges_only=True)
+        self.view = FragmapView(Fragmap.from_diffs(diffs), height=2, width=3)
+
+    def test_scroll_to_cursor(self):
+        self.assertEqual(["#..", ".#."], self.view.visible_rows())
+        self.view.move(3, 4)
+        self.assertEqual((2, 2), (self.view.top, self.view.left))
+        self.assertEqual(["#..", ".#."], self.view.visible_rows())
+        self.view.move(100, -1)
+        self.assertEqual(
+            (4, 3), (self.view.cursor_row, self.view.cursor_column)
+        )
+        self.assertEqual((3, 2), (self.view.top, self.view.left))
+        self.assertEqual([".#.", "..#"], self.view.visible_rows())
+
+    def test_max_columns(self):
+        self.view.max_columns = 2
+        self.view.resize(5, 10)
+        self.assertEqual((5, 2), (self.view.height, self.view.width))
+        self.assertEqual(
+            ["#.", ".#", "..", "..", ".."], self.view.visible_rows()
+        )
+
+    def test_jump_between_files(self):
+        self.view.next_file()
+        self.assertEqual(1, self.view.cursor_column)
+        self.view.move(0, 2)
+        self.view.next_file()
+        self.assertEqual(3, self.view.cursor_column)
+        self.view.previous_file()
+        self.assertEqual(0, self.view.cursor_column)
+
+    def test_status_shows_hunk(self):
+        self.view.move(1, 1)
+        status = self.view.status()
+        self.assertTrue(status.endswith(" file_b.txt @@ -0,0 +1,1 @@"), status)
+        self.view.move(1, 0)
+        self.assertTrue(self.view.status().endswith(" file_b.txt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright 2016-2021 Alexander Mollberg
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from math import inf
+
+from infrastructure import TWOFILES_REPO
+from mock import patch
+
+from fragmap import update
+from fragmap.commitdiff import CommitDiff
+from fragmap.generate_matrix import Fragmap
+from fragmap.span import Overlap, Span
+from fragmap.spg import SINK, FileId, Node
+from fragmap.update import (
+    OverlapIndex,
+    SPGBuilder,
+    balanced_bins,
+    node_by_new,
+)
+
+
+class Uncommitted(object):
+    pass
+
+
+class SPGBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.diffs = TWOFILES_REPO.load(ranges_only=True)
+
+    def test_add_generations_on_top(self):
+        builder = SPGBuilder()
+        builder.build(self.diffs[0:3])
+        self.assertEqual(2, self.updated_generations(builder, self.diffs))
+        self.assertBuiltLikeFresh(builder, self.diffs)
+
+    def test_rebuild_from_changed_generation(self):
+        builder = SPGBuilder()
+        builder.build(self.diffs)
+        changed = self.diffs[0:2] + self.diffs[3:5]
+        self.assertEqual(2, self.updated_generations(builder, changed))
+        self.assertBuiltLikeFresh(builder, changed)
+
+    def test_rebuild_fewer_generations(self):
+        builder = SPGBuilder()
+        builder.build(self.diffs)
+        self.assertEqual(0, self.updated_generations(builder, self.diffs[0:1]))
+        self.assertBuiltLikeFresh(builder, self.diffs[0:1])
+
+    def test_always_rebuild_uncommitted(self):
+        uncommitted = [
+            CommitDiff(Uncommitted(), diff.filepatches)
+            for diff in self.diffs[3:5]
+        ]
+        builder = SPGBuilder()
+        builder.build(self.diffs[0:3] + uncommitted)
+        self.assertEqual(
+            2, self.updated_generations(builder, self.diffs[0:3] + uncommitted)
+        )
+        self.assertBuiltLikeFresh(builder, self.diffs[0:3] + uncommitted)
+
+    def test_skip_unchanged_generations(self):
+        builder = SPGBuilder()
+        builder.build(self.diffs)
+        # file_a.txt is only changed by the first commit, so only that one
+        # and the following unchanged generation are in its graph
+        spg = builder.spgs[FileId(-1, "file_a.txt")]
+        self.assertEqual(
+            [-1, 0, 1],
+            sorted(set([node.generation for node in spg.nodes()])),
+        )
+        column_lengths = set(
+            [len(path.nodes) for path in Fragmap.from_diffs(self.diffs).paths()]
+        )
+        self.assertEqual({len(self.diffs) + 2}, column_lengths)
+
+    def test_parallel_build(self):
+        builder = SPGBuilder(jobs=2)
+        builder.build(self.diffs[0:3])
+        self.assertBuiltLikeFresh(builder, self.diffs[0:3])
+        builder.build(self.diffs)
+        self.assertBuiltLikeFresh(builder, self.diffs)
+
+    def test_balanced_bins(self):
+        self.assertEqual([[0, 4], [2, 1, 3]], balanced_bins([9, 3, 5, 1, 1], 2))
+        self.assertEqual([[0]], balanced_bins([9], 4))
+
+    def updated_generations(self, builder, diffs):
+        with patch.object(
+            update, "update_commit_diff", wraps=update.update_commit_diff
+        ) as update_commit_diff:
+            builder.build(diffs)
+        return update_commit_diff.call_count
+
+    def assertBuiltLikeFresh(self, builder, diffs):
+        fresh = SPGBuilder()
+        fresh.build(diffs)
+        self.assertEqual(fresh.renames, builder.renames)
+        self.assertEqual(fresh.spgs, builder.spgs)
+        self.assertEqual(list(fresh.spgs), list(builder.spgs))
+        for spg in builder.spgs.values():
+            self.assertEqual(
+                [node for node, ends in spg.items() if SINK in ends],
+                list(spg.frontier),
+            )
+
+
+class OverlapIndexTest(unittest.TestCase):
+    def test_same_as_overlap_with_each_node(self):
+        nodes = sorted(
+            [
+                Node.inactive((0, 0), span.to_git(), 0)
+                for span in [
+                    Span(1, 3),
+                    Span(3, 3),
+                    Span(3, 6),
+                    Span(6, 6),
+                    Span(6, 10),
+                    Span(10, inf),
+                ]
+            ],
+            key=node_by_new,
+        )
+        index = OverlapIndex.from_nodes_by_new(nodes)
+        for start in range(0, 12):
+            for end in range(start, 12):
+                span = Span(start, end)
+                self.assertEqual(
+                    [
+                        node
+                        for node in nodes
+                        if span.overlap(Span.from_new(node.hunk))
+                        != Overlap.NO_OVERLAP
+                    ],
+                    index.overlapping(span),
+                    span,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()